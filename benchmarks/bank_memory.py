@@ -0,0 +1,62 @@
+"""
+Measures the memory held by a loaded sequence-heavy bank: the bytes
+allocated per MIDI message in its sequence grids and per rule, and
+the resident set size of the process after loading.
+
+Usage: python benchmarks/bank_memory.py [patches] [steps]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+from fluidpatcher.bankfiles import Bank, MidiMessage, MidiRule
+
+from sequence_grid import sequence_bank
+
+
+RULES = """\
+    rules:
+    - {type: note, chan: 1=2, num: C2-C4}
+    - {type: cc, chan: 1, num: 7, val: 0-127=0-100}
+    - {type: pbend, chan: 1=2-3}
+"""
+
+
+def rss():
+    # current resident set size in bytes (Linux only)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def count(bank, cls):
+    n = 0
+    for zone in bank:
+        for seq in zone.get("sequences", {}).values():
+            n += sum(
+                isinstance(e, cls)
+                for pattern in seq.events for track in pattern for e in track
+            )
+        n += sum(isinstance(r, cls) for r in zone.get("rules", []))
+    return n
+
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 200
+    steps = int(sys.argv[2]) if sys.argv[2:] else 64
+    text = sequence_bank(n, steps).replace("    sequences:\n", RULES + "    sequences:\n")
+    gc.collect()
+    before = rss()
+    tracemalloc.start()
+    bank = Bank(text)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    msgs, rules = count(bank, MidiMessage), count(bank, MidiRule)
+    print(f"{n} patches, {msgs} messages, {rules} rules")
+    print(f"allocated: {size / 2**20:.1f} MiB, {size / msgs:.0f} bytes per message")
+    print(f"RSS after load: {rss() / 2**20:.1f} MiB (+{(rss() - before) / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
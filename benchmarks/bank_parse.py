@@ -0,0 +1,64 @@
+"""
+Compares YAML parse times of the pure-Python and libyaml-based bank
+loaders over the bundled banks and a large synthetic bank.
+
+Usage: python benchmarks/bank_parse.py [patches]
+"""
+import importlib.resources as res
+import sys
+import time
+
+import yaml
+
+from fluidpatcher import bankfiles
+
+
+def synthetic_bank(n):
+    patch = """\
+  patch{i}:
+    1: test.sf2:000:{prog:03d}
+    2: test.sf2:000:{prog2:03d}
+    rules:
+    - {{type: note, chan: 1=2, num: C3-C5*1+12}}
+    - {{type: cc, num: 7, val: 0-127=0.0-1.0, fluidsetting: synth.gain}}
+    messages: [cc:1:7:100, cc:1:10:64, cc:2:91:40]
+"""
+    return "patches:\n" + "".join(
+        patch.format(i=i, prog=i % 128, prog2=(i + 1) % 128) for i in range(n)
+    )
+
+
+def best_of(func, repeats=3):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 2000
+    banks = {
+        f.name: f.read_text()
+        for f in (res.files("fluidpatcher.data") / "banks").iterdir()
+        if f.name.endswith(".yaml")
+    }
+    banks[f"synthetic ({n} patches)"] = synthetic_bank(n)
+    loaders = [bankfiles.BankLoader]
+    if yaml.__with_libyaml__:
+        loaders.append(bankfiles.CBankLoader)
+    else:
+        print("libyaml not available, only timing the pure-Python loader")
+    for name, text in banks.items():
+        times = [best_of(lambda: yaml.load(text, Loader=L)) for L in loaders]
+        line = "  ".join(
+            f"{L.__name__} {1000 * t:9.2f} ms" for L, t in zip(loaders, times)
+        )
+        if len(times) > 1:
+            line += f"  ({times[0] / times[1]:.1f}x)"
+        print(f"{name:26} {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares how long MIDI input is held up when changing banks, between
+load_bank() and a standby engine prepared with prepare_bank() and
+switched to with switch_bank(). Runs offline, so no sound card is
+needed - the soundfont loads and patch setup it times are the same.
+
+Usage: python benchmarks/bank_switch.py [bankfile] [otherbank] [runs]
+"""
+import sys
+import time
+
+from fluidpatcher import FluidPatcher
+
+
+def main():
+    banks = sys.argv[1:3] if sys.argv[2:] else ["testbank.yaml", "tutorial/lesson04_players.yaml"]
+    runs = int(sys.argv[3]) if sys.argv[3:] else 5
+    fp = FluidPatcher(fluidlog=-1, offline=True)
+    fp.load_bank(banks[0])
+    fp.apply_patch(fp.bank.patches[0])
+    loads, switches = [], []
+    for i in range(runs):
+        bank = banks[(i + 1) % 2]
+        t = time.perf_counter()
+        fp.load_bank(bank)
+        fp.apply_patch(fp.bank.patches[0])
+        loads.append(time.perf_counter() - t)
+        fp.prepare_bank(banks[i % 2])
+        fp.render(0.5) # keep playing while the standby engine loads
+        fp.switch_bank()
+        switches.append(fp.switch_times)
+    print(f"load_bank + apply_patch: {1000 * min(loads):8.2f} ms of dead input")
+    print(f"switch_bank:             {1000 * min(s['switch'] for s in switches):8.2f} ms of dead input")
+    print(f"  standby prepare:       {1000 * min(s['prepare'] for s in switches):8.2f} ms in the background")
+    print(f"  waited for prepare:    {1000 * max(s['wait'] for s in switches):8.2f} ms at most")
+
+
+if __name__ == "__main__":
+    main()
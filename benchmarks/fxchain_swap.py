@@ -0,0 +1,55 @@
+"""
+Times LADSPA effect chain changes in apply_patch. While the chain is
+rebuilt the LADSPA host is reset, so the rebuild time is the length
+of the audio dropout. Patches whose chains only differ in control
+values are updated in place and should not interrupt audio.
+
+Uses the bundled patchcord plugin, so LADSPA support and a built
+patchcord.so are required.
+
+Usage: python benchmarks/fxchain_swap.py [repeats]
+"""
+import sys
+import time
+
+from fluidpatcher import FluidPatcher
+from fluidpatcher.config import PATCHCORD
+
+BANK = """
+patches:
+  A:
+    ladspafx:
+      cord: {{lib: {lib}, chan: 1}}
+  B:
+    ladspafx:
+      cord: {{lib: {lib}, chan: 2}}
+  C:
+    ladspafx:
+      cord: {{lib: {lib}, chan: 1}}
+"""
+
+
+def timed(fp, patch):
+    t = time.perf_counter()
+    fp.apply_patch(patch)
+    return time.perf_counter() - t
+
+
+def main():
+    if not PATCHCORD:
+        sys.exit("patchcord plugin not available")
+    repeats = int(sys.argv[1]) if sys.argv[1:] else 50
+    fp = FluidPatcher(fluidlog=-1)
+    fp.load_bank(raw=BANK.format(lib=PATCHCORD["_patchcord"].lib))
+    rebuild, inplace = [], []
+    for _ in range(repeats):
+        rebuild.append(timed(fp, "A"))
+        inplace.append(timed(fp, "C"))
+        rebuild.append(timed(fp, "B"))
+    for label, times in ("topology change", rebuild), ("same topology", inplace):
+        print(f"{label:16} mean {1000 * sum(times) / len(times):7.3f} ms"
+              f"  worst {1000 * max(times):7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Times importing the package in fresh interpreters, and checks that it
+stays within a budget and doesn't load the configuration or the
+FluidSynth library.
+
+Usage: python benchmarks/import_time.py [runs]
+"""
+import subprocess
+import sys
+
+
+# budgets in milliseconds, measured inside the interpreter, with room
+# for slower machines than a desktop (a Pi 4 takes several times longer)
+BUDGETS = {
+    "fluidpatcher": 10,
+    "fluidpatcher.bankfiles": 80,
+}
+
+PROBE = """\
+import sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+side_effects = [m for m in ("fluidpatcher.config", "fluidpatcher.pfluidsynth") if m in sys.modules]
+print(t, *side_effects)
+"""
+
+
+def time_import(module, runs):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        times.append(float(out[0]))
+    return min(times), out[1:]
+
+
+def main():
+    runs = int(sys.argv[1]) if sys.argv[1:] else 5
+    ok = True
+    for module, budget in BUDGETS.items():
+        t, side_effects = time_import(module, runs)
+        within = 1000 * t <= budget and not side_effects
+        ok = ok and within
+        print(
+            f"import {module}: {1000 * t:.1f} ms (budget {budget} ms)"
+            + "".join(f", imported {m}" for m in side_effects)
+            + ("" if within else "  OVER")
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compares load time and memory of eager and lazy bank parsing on a large
+synthetic bank, and the cost of touching a few patches afterwards.
+
+Usage: python benchmarks/lazy_bank.py [patches]
+"""
+import sys
+import time
+import tracemalloc
+
+from fluidpatcher.bankfiles import Bank
+
+from bank_parse import synthetic_bank
+
+
+def measure(text, lazy, touch=20):
+    tracemalloc.start()
+    t = time.perf_counter()
+    bank = Bank(text, lazy=lazy)
+    load = time.perf_counter() - t
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t = time.perf_counter()
+    for name in bank.patches[:touch]:
+        bank[name]
+    access = time.perf_counter() - t
+    return load, retained, peak, access
+
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 5000
+    text = synthetic_bank(n)
+    print(f"synthetic bank, {n} patches")
+    for lazy in (False, True):
+        load, retained, peak, access = measure(text, lazy)
+        print(
+            f"{'lazy' if lazy else 'eager':6} load {load:7.3f} s  "
+            f"retained {retained / 2**20:6.1f} MB  peak {peak / 2**20:6.1f} MB  "
+            f"20 patches {1000 * access:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
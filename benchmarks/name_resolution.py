@@ -0,0 +1,65 @@
+"""
+Times validation of a bank with a ``names`` table and many rules and
+messages that refer to names, notes and repeated route specs.
+
+Usage: python benchmarks/name_resolution.py [patches]
+"""
+import sys
+import time
+
+from fluidpatcher.bankfiles import Bank
+
+
+NAMES = """\
+names:
+  slider1: 13
+  slider2: 14
+  pad1: 50
+  pad2: 51
+  volume: 7
+  expression: 11
+  brightness: 74
+  reverb: 91
+  chorus: 93
+  lowsplit: C3
+  highsplit: C5
+"""
+
+PATCH = """\
+  patch{i}:
+    1: test.sf2:000:{prog:03d}
+    rules:
+    - {{type: note, chan: 1=2, num: lowsplit-highsplit*1+12}}
+    - {{type: note, chan: 1=3, num: C#1-B2}}
+    - {{type: cc, chan: 1, num: slider1=volume, val: 0-127=0-1}}
+    - {{type: cc, chan: 1, num: slider2=expression, val: 0-127=0-1}}
+    - {{type: cc, chan: 1=2, num: pad1=brightness, val: 1-127=0-127}}
+    - {{type: cc, chan: 1=3, num: pad2=reverb, val: 0-127=40-100}}
+    messages: [cc:1:volume:100, cc:1:reverb:40, cc:2:chorus:20, note:1:C4:0]
+"""
+
+
+def names_bank(n):
+    return NAMES + "patches:\n" + "".join(
+        PATCH.format(i=i, prog=i % 128) for i in range(n)
+    )
+
+
+def best_of(func, repeats=3):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 1000
+    text = names_bank(n)
+    t = best_of(lambda: Bank(text))
+    print(f"{n} patches: {1000 * t:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
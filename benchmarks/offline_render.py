@@ -0,0 +1,40 @@
+"""
+Renders a few seconds of notes through every patch of a bank with an
+offline FluidPatcher, and reports how much faster than real time each
+patch renders. Needs no sound card, so it runs on headless machines.
+
+Usage: python benchmarks/offline_render.py [bankfile] [seconds]
+"""
+import sys
+import time
+
+from fluidpatcher import FluidPatcher, MidiMessage
+
+
+def notes(seconds, chan=1):
+    # a rising run of eighth notes at 120 bpm, two voices at a time
+    events = []
+    for i in range(int(seconds * 4)):
+        for num in 48 + i % 24, 60 + i % 24:
+            events.append((i / 4, MidiMessage(type="note", chan=chan, num=num, val=100)))
+            events.append((i / 4 + 0.5, MidiMessage(type="note", chan=chan, num=num, val=0)))
+    return events
+
+
+def main():
+    bankfile = sys.argv[1] if sys.argv[1:] else "testbank.yaml"
+    seconds = float(sys.argv[2]) if sys.argv[2:] else 10
+    fp = FluidPatcher(fluidlog=-1, offline=True)
+    fp.load_bank(bankfile)
+    events = notes(seconds)
+    for patch in fp.bank.patches:
+        fp.apply_patch(patch)
+        t = time.perf_counter()
+        audio = fp.render(seconds, events)
+        t = time.perf_counter() - t
+        peak = max(map(abs, audio), default=0)
+        print(f"{patch:24} {seconds / t:7.1f}x real time  peak {peak:.3f}")
+
+
+if __name__ == "__main__":
+    main()
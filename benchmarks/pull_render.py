@@ -0,0 +1,49 @@
+"""
+Pulls audio from an offline FluidPatcher into the same pair of buffers
+over and over while notes play, and reports how many frames per second
+one core renders at each block size. Compares against ``render()``,
+which copies every block into a new array.
+
+Usage: python benchmarks/pull_render.py [bankfile] [seconds]
+"""
+from array import array
+import sys
+import time
+
+from fluidpatcher import FluidPatcher, MidiMessage
+
+BLOCKSIZES = 64, 256, 1024, 4096
+
+
+def play_chord(fp, val):
+    for num in 48, 55, 60, 64, 67, 72:
+        fp.send_midimessage(MidiMessage(type="note", chan=1, num=num, val=val))
+
+
+def main():
+    bankfile = sys.argv[1] if sys.argv[1:] else "testbank.yaml"
+    seconds = float(sys.argv[2]) if sys.argv[2:] else 10
+    fp = FluidPatcher(fluidlog=-1, offline=True)
+    fp.load_bank(bankfile)
+    fp.apply_patch(fp.bank.patches[0])
+    rate = fp.fluidsetting("synth.sample-rate")
+    frames = int(seconds * rate)
+    for blocksize in BLOCKSIZES:
+        buffers = [array("f", bytes(4 * blocksize)) for _ in range(2)]
+        play_chord(fp, 100)
+        t = time.process_time()
+        for _ in range(frames // blocksize):
+            fp.pull(buffers)
+        t = time.process_time() - t
+        play_chord(fp, 0)
+        print(f"pull   {blocksize:5} frames/block  {frames / t:12,.0f} frames/s")
+    play_chord(fp, 100)
+    t = time.process_time()
+    fp.render(seconds)
+    t = time.process_time() - t
+    play_chord(fp, 0)
+    print(f"render {4096:5} frames/block  {frames / t:12,.0f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
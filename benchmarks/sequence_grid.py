@@ -0,0 +1,58 @@
+"""
+Times loading of a sequence-heavy bank, where each patch has a
+multi-line drum grid of ``events`` with one token per cell.
+
+Usage: python benchmarks/sequence_grid.py [patches] [steps]
+"""
+import sys
+import time
+
+from fluidpatcher.bankfiles import Bank
+
+
+def grid(steps, tracks=8):
+    rows = []
+    for step in range(steps):
+        cells = []
+        for track in range(tracks):
+            if (step + track) % 4 == 0:
+                cells.append(f"note:10:{36 + track}:{80 + step % 4 * 10}")
+            elif step % 2:
+                cells.append("_")
+            else:
+                cells.append("+")
+        rows.append("          " + " ".join(cells) + "\n")
+    return "".join(rows)
+
+
+def sequence_bank(n, steps):
+    events = grid(steps)
+    return "patches:\n" + "".join(
+        f"  patch{i}:\n"
+        f"    sequences:\n"
+        f"      drums:\n"
+        f"        order: 1, 2, 1, 2\n"
+        f"        events: |\n{events}\n{events}"
+        for i in range(n)
+    )
+
+
+def best_of(func, repeats=3):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if sys.argv[1:] else 50
+    steps = int(sys.argv[2]) if sys.argv[2:] else 64
+    text = sequence_bank(n, steps)
+    t = best_of(lambda: Bank(text))
+    print(f"{n} patches, 2 x {steps} steps x 8 tracks: {1000 * t:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
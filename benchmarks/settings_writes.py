@@ -0,0 +1,45 @@
+"""
+Measures fluidsetting writes per second through Synth.__setitem__,
+compared with the generic settings API the router used to call
+on every write (type lookup and name encoding each time).
+
+Usage: python benchmarks/settings_writes.py [seconds]
+"""
+import sys
+import time
+from ctypes import c_double
+
+from fluidpatcher.pfluidsynth import FS, Synth, FLUID_NUM_TYPE
+
+SETTINGS = ["synth.gain", "synth.reverb.room-size", "synth.chorus.depth"]
+
+
+def generic_write(synth, name, val):
+    if FS.fluid_settings_get_type(synth.st, name.encode()) == FLUID_NUM_TYPE:
+        FS.fluid_settings_setnum(synth.st, name.encode(), c_double(float(val)))
+
+
+def rate(func, seconds):
+    n = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for i in range(1000):
+            func(i / 2000)
+        n += 1000
+    return n / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if sys.argv[1:] else 1.0
+    synth = Synth(fluidsettings={"audio.driver": "file",
+                                 "audio.file.name": "/dev/null",
+                                 "midi.driver": "none"})
+    for name in SETTINGS:
+        old = rate(lambda v: generic_write(synth, name, v), seconds)
+        new = rate(lambda v: synth.__setitem__(name, v), seconds)
+        print(f"{name:24} generic {old:10.0f}/s  "
+              f"accessor {new:10.0f}/s  ({new / old:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
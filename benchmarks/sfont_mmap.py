@@ -0,0 +1,50 @@
+"""
+Loads a soundfont in fresh processes, once with FluidSynth's default
+file reading and once through memory maps, and reports the load time
+and the memory each process ends up using. The file is read once
+beforehand, so both loaders start from a warm page cache.
+
+Usage: python benchmarks/sfont_mmap.py [sf2file] [runs]
+"""
+from pathlib import Path
+import subprocess
+import sys
+
+from fluidpatcher import CONFIG
+
+PROBE = """\
+import resource, time
+from fluidpatcher import pfluidsynth
+pfluidsynth.sfont_registry.mmap = {mmap}
+synth = pfluidsynth.Synth(offline=True)
+t = time.perf_counter()
+synth.load_soundfont({path!r})
+t = time.perf_counter() - t
+print(t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def load(path, mmap, runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(path=str(path), mmap=mmap)],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        results.append((float(out[0]), float(out[1])))
+    return min(results)
+
+
+def main():
+    path = Path(sys.argv[1]) if sys.argv[1:] else Path("FluidR3_GM.sf2")
+    runs = int(sys.argv[2]) if sys.argv[2:] else 3
+    path = CONFIG["sounds_path"] / path
+    path.read_bytes() # warm the page cache
+    print(f"{path.name}: {path.stat().st_size / 2**20:.1f} MB")
+    for name, mmap in ("default", False), ("mmap", True):
+        t, rss = load(path, mmap, runs)
+        print(f"{name:8} {1000 * t:8.1f} ms  {rss:8.1f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
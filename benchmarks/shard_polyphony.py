@@ -0,0 +1,66 @@
+"""
+Finds the most voices an offline FluidPatcher can render in real time
+with 1, 2 and 4 shards (worker processes). The first preset of the
+first patch is put on all 16 MIDI channels, and chords are held across
+the channels while the voice count doubles, until rendering falls
+behind real time - the point where a live synth would drop out.
+
+Usage: python benchmarks/shard_polyphony.py [bankfile] [seconds]
+"""
+import sys
+import time
+
+from fluidpatcher import FluidPatcher, MidiMessage
+
+SHARDS = 1, 2, 4
+MAX_VOICES = 4096
+
+
+def chord(voices, val):
+    # spread the notes evenly over the channels
+    return [
+        (0, MidiMessage(type="note", chan=1 + i % 16, num=24 + i // 16 % 80, val=val))
+        for i in range(voices)
+    ]
+
+
+def max_voices(shards, bankfile, seconds):
+    fp = FluidPatcher(
+        fluidsettings={"synth.polyphony": MAX_VOICES},
+        fluidlog=-1,
+        offline=True,
+        shards=shards,
+    )
+    fp.load_bank(bankfile)
+    patch = fp.bank.patches[0]
+    preset = next(fp.bank[patch][chan] for chan in range(1, 17) if fp.bank[patch][chan])
+    for chan in range(1, 17):
+        fp.bank.patch[patch][chan] = preset
+    fp.apply_patch(patch)
+    best, voices = 0, 16
+    while voices <= MAX_VOICES:
+        fp.render(0.1, chord(voices, 100))
+        t = time.perf_counter()
+        fp.render(seconds)
+        speed = seconds / (time.perf_counter() - t)
+        fp.render(0.5, chord(voices, 0))
+        print(f"  {voices:5} voices  {speed:6.2f}x real time")
+        if speed < 1:
+            break
+        best, voices = voices, voices * 2
+    return best
+
+
+def main():
+    bankfile = sys.argv[1] if sys.argv[1:] else "testbank.yaml"
+    seconds = float(sys.argv[2]) if sys.argv[2:] else 2
+    results = {}
+    for shards in SHARDS:
+        print(f"{shards} shard(s):")
+        results[shards] = max_voices(shards, bankfile, seconds)
+    for shards, voices in results.items():
+        print(f"{shards} shard(s): {voices} voices in real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Starts several offline FluidPatchers in one process, each applying the
+first patch of the same bank, and reports how much memory and time
+each one adds. Every synth loads its own copy of the soundfonts, but
+copies after the first are read from the OS page cache.
+
+Usage: python benchmarks/shared_soundfonts.py [bankfile] [instances]
+"""
+import resource
+import sys
+import time
+
+from fluidpatcher import FluidPatcher
+
+
+def rss_mb():
+    # peak resident size, in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    bankfile = sys.argv[1] if sys.argv[1:] else "testbank.yaml"
+    instances = int(sys.argv[2]) if sys.argv[2:] else 4
+    patchers = []
+    last = rss_mb()
+    for i in range(instances):
+        t = time.perf_counter()
+        fp = FluidPatcher(fluidlog=-1, offline=True)
+        fp.load_bank(bankfile)
+        fp.apply_patch(fp.bank.patches[0])
+        t = time.perf_counter() - t
+        patchers.append(fp)
+        now = rss_mb()
+        print(
+            f"instance {i + 1}: +{now - last:7.1f} MB {1000 * t:8.1f} ms"
+            f"  ({len(fp.soundfonts)} soundfonts)"
+        )
+        last = now
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ Key components:
   - bankfiles.py – YAML extensions and helpers for parsing banks
   - config.py - configuration loading and initialization
   - router.py – live MIDI routing and rule processing
+  - render.py – offline rendering to memory or WAV files
   - pfluidsynth.py – ctypes bindings and custom implementations
     as lightweight wrappers around FluidSynth objects
 
@@ -24,19 +25,39 @@ Requirements:
   - libfluidsynth
 """
 
-from importlib.metadata import version, PackageNotFoundError
-
-from .bankfiles import MidiMessage, MidiRule, SFPreset
-from .config import CONFIG, save_config
-from .patcher import FluidPatcher
-from .pfluidsynth import FluidMidiEvent
-
+from importlib import import_module
 
 __all__ = ["MidiMessage", "MidiRule", "SFPreset", "CONFIG",
            "save_config", "FluidPatcher", "FluidMidiEvent"]
 
-try:
-    __version__ = version("fluidpatcher")
-except PackageNotFoundError:
-    __version__ = "0.0.0-dev"
-
+# the public names are imported on first use, so that importing the
+# package (e.g. just to parse banks) doesn't read the configuration or
+# load the FluidSynth library
+_SUBMODULES = {
+    "MidiMessage": ".bankfiles",
+    "MidiRule": ".bankfiles",
+    "SFPreset": ".bankfiles",
+    "CONFIG": ".config",
+    "save_config": ".config",
+    "FluidPatcher": ".patcher",
+    "FluidMidiEvent": ".pfluidsynth",
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        value = getattr(import_module(_SUBMODULES[name], __name__), name)
+    elif name == "__version__":
+        from importlib.metadata import version, PackageNotFoundError
+        try:
+            value = version("fluidpatcher")
+        except PackageNotFoundError:
+            value = "0.0.0-dev"
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | {"__version__"})
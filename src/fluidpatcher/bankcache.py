@@ -0,0 +1,115 @@
+"""
+On-disk cache of compiled banks.
+
+Parsing and validating a large bank can take seconds on small boards.
+After a bank file is loaded, the validated Bank object is pickled to
+CONFIG["cache_path"] together with a manifest of the bank and every
+file it includes. Later loads check the manifest and reuse the
+compiled bank if none of those files changed.
+
+The manifest records the exact bytes each file had when it was read
+for parsing. Files are considered unchanged if their size and mtime
+match. If only the mtime differs, the contents are hashed and
+compared, so touching or re-saving a file doesn't invalidate its cache
+entry. Entries written by a different version of ``bankfiles.py`` are
+never reused.
+"""
+import hashlib
+from pathlib import Path
+import pickle
+
+from . import bankfiles
+from .config import CONFIG
+
+CACHE_VERSION = 5
+
+_code = None
+
+
+def _entry(path):
+    path = path.resolve()
+    return CONFIG["cache_path"] / (
+        hashlib.sha1(str(path).encode()).hexdigest() + ".pickle"
+    )
+
+
+def _code_version():
+    # compiled banks are bankfiles objects, so an entry written by other
+    # code is stale even if CACHE_VERSION wasn't bumped
+    global _code
+    if _code is None:
+        _code = hashlib.sha1(Path(bankfiles.__file__).read_bytes()).hexdigest()
+    return CACHE_VERSION, _code
+
+
+def fingerprint(path, mtime, data):
+    """
+    Describes the contents of a source file for the manifest.
+
+    Args:
+      path (Path): The file
+      mtime (int): Its ``st_mtime_ns``, taken before it was read
+      data (bytes): The bytes that were read and parsed
+    """
+    return str(path.resolve()), mtime, len(data), hashlib.sha1(data).hexdigest()
+
+
+def _unchanged(fingerprint):
+    name, mtime, size, digest = fingerprint
+    try:
+        path = Path(name)
+        st = path.stat()
+        if st.st_size != size:
+            return False
+        if st.st_mtime_ns == mtime:
+            return True
+        return hashlib.sha1(path.read_bytes()).hexdigest() == digest
+    except OSError:
+        return False
+
+
+def load(bankfile, lazy=False):
+    """
+    Returns the cached Bank for a bank file, or None if there is no
+    cache entry, it was compiled in a different mode, or any of the
+    bank's source files changed.
+    """
+    if CONFIG.get("cache_path") is None:
+        return None
+    try:
+        with open(_entry(CONFIG["banks_path"] / bankfile), "rb") as f:
+            version, mode, manifest = pickle.load(f)
+            if version != _code_version() or mode != lazy:
+                return None
+            if not all(_unchanged(fp) for fp in manifest):
+                return None
+            return pickle.load(f)
+    except Exception:
+        # missing, truncated or incompatible entries are just rebuilt
+        return None
+
+
+def store(bankfile, manifest, bank, lazy=False):
+    """
+    Writes a compiled bank to the cache.
+
+    Args:
+      bankfile (str|Path): Bank file the bank was loaded from
+      manifest (list[tuple]): A ``fingerprint()`` of the bank file and
+        every included file, as they were read for parsing
+      bank (Bank): The validated bank
+      lazy (bool): Whether the bank was loaded in lazy mode
+    """
+    if CONFIG.get("cache_path") is None:
+        return
+    try:
+        CONFIG["cache_path"].mkdir(parents=True, exist_ok=True)
+        entry = _entry(CONFIG["banks_path"] / bankfile)
+        tmp = entry.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((_code_version(), lazy, manifest), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(bank, f, pickle.HIGHEST_PROTOCOL)
+        tmp.replace(entry)
+    except Exception:
+        # caching is an optimization, never a reason to fail a load
+        pass
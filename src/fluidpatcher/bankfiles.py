@@ -12,8 +12,10 @@ It enables FluidPatcher to treat YAML as a rich declarative language for
 describing patches, MIDI routing, sequencing, and effects.
 """
 
+from collections.abc import Hashable
 from copy import deepcopy
 import re
+import sys
 
 import yaml
 
@@ -56,6 +58,13 @@ def resolve(s, names={}):
     Raises:
       BankValidationError: if ``s`` cannot be interpreted or resolved
     """
+    if isinstance(s, str) and isinstance(names, _Names):
+        if s not in names.resolved:
+            names.resolved[s] = _resolve(s, names)
+        return names.resolved[s]
+    return _resolve(s, names)
+
+def _resolve(s, names):
     if s in names:
         s = names[s]
     if isinstance(s, str):
@@ -76,6 +85,189 @@ def resolve(s, names={}):
                     s = int(s)
     return s
 
+class _Names(dict):
+    """
+    Copy of a bank's ``names`` that also holds the values and route
+    specs resolved against it, so repeats are only worked out once
+    """
+
+    def __init__(self, names):
+        super().__init__(names)
+        self.resolved = {}
+        self.routes = {}
+
+
+def _scoped(names):
+    return _Names(names) if isinstance(names, dict) else names
+
+def _load(text, lazy=False):
+    try:
+        if lazy and (root := _load_lazy(text)) is not None:
+            return root
+        return yaml.load(text, Loader=BANK_LOADERS[0])
+    except yaml.YAMLError as e:
+        if BANK_LOADERS[0] is not BankLoader:
+            # the pure-Python parser gives more detailed error marks
+            try:
+                yaml.load(text, Loader=BankLoader)
+            except yaml.YAMLError as e:
+                raise BankSyntaxError.from_yamlexc(e)
+        raise BankSyntaxError.from_yamlexc(e)
+
+def _load_lazy(text):
+    if (scan := _scan(text)) is None:
+        return None
+    roottext, patches = scan
+    root = yaml.load(roottext, Loader=BANK_LOADERS[0])
+    root["patches"] = _LazyPatches(root)
+    for name, _, src in patches:
+        root["patches"].add(name, src)
+    return root
+
+def _load_incremental(text, previous):
+    # construct and validate only the root section and patches whose
+    # source text differs from the previous parse
+    try:
+        scan = _scan(text)
+    except yaml.YAMLError:
+        return None
+    if scan is None:
+        return None
+    roottext, items = scan
+    prevtext, prevroot = previous.get(None, ("", {}))
+    rootparsed = roottext != prevtext
+    root = _load(roottext) if rootparsed else dict(prevroot)
+    names = root.get("names", {})
+    # names are resolved during validation, so if they changed every
+    # patch has to be validated again
+    reuse = names == prevroot.get("names", {})
+    patches, entries = {}, []
+    for name, key, src in items:
+        if reuse and (key, src.text) in previous:
+            patch, parsed = previous[key, src.text], False
+        else:
+            patch, parsed = src.load(), True
+        patches[name] = patch
+        entries.append((name, (key, src.text), patch, parsed))
+    # a patch overridden by a later one with the same name isn't part of
+    # the bank, so it is neither validated nor kept for reuse
+    entries = [e for e in entries if patches[e[0]] is e[2]]
+    names = _scoped(names)
+    # validate in the same order as a full parse
+    for k, v in root.items():
+        if k != "patches":
+            if rootparsed:
+                _walk(v, path=(k,), names=names)
+            continue
+        for name, _, patch, parsed in entries:
+            if parsed:
+                _walk(patch, path=("patches", name), names=names)
+    sources = {None: (roottext, dict(root))}
+    for _, source, patch, _ in entries:
+        sources[source] = patch
+    root["patches"] = patches
+    return root, sources
+
+def _scan(text):
+    # locate the patches with a quick pass over the parser events, and
+    # split the text into the root section with an empty placeholder for
+    # the patches, and the name, key text and source of each patch
+    loader = BANK_LOADERS[0](text)
+    try:
+        events = iter(loader.get_event, None)
+        next(events), next(events) # stream and document start
+        if not isinstance(next(events), yaml.MappingStartEvent):
+            return None
+        for key in events:
+            if isinstance(key, yaml.MappingEndEvent):
+                return None
+            start = next(events)
+            if (
+                isinstance(key, yaml.ScalarEvent) and key.value == "patches"
+                and isinstance(start, yaml.MappingStartEvent)
+            ):
+                break
+            _skip_node(events, start)
+        sources = []
+        for key in events:
+            if isinstance(key, yaml.MappingEndEvent):
+                end = key
+                break
+            first = next(events)
+            last, sfonts, aliased = _skip_node(events, first)
+            if aliased or not isinstance(key, yaml.ScalarEvent):
+                # anchors/aliases may refer to text outside the patch
+                return None
+            sources.append((key, _Unparsed(
+                " " * first.start_mark.column
+                + text[first.start_mark.index:last.end_mark.index],
+                first.start_mark.line, sfonts
+            )))
+        # check the rest of the stream for errors, a second patches
+        # section or extra documents
+        for key in events:
+            if isinstance(key, yaml.MappingEndEvent):
+                break
+            if isinstance(key, yaml.ScalarEvent) and key.value == "patches":
+                return None
+            _skip_node(events, next(events))
+        if any(isinstance(e, yaml.DocumentStartEvent) for e in events):
+            return None
+    finally:
+        loader.dispose()
+    i, j = start.start_mark.index, end.end_mark.index
+    # keep the line count so marks in the root section stay accurate
+    roottext = text[:i] + "{}" + "\n" * text.count("\n", i, j) + text[j:]
+    keys = [text[k.start_mark.index:k.end_mark.index] for k, _ in sources]
+    if any("\n" in k for k in keys):
+        names = [yaml.load(k, Loader=BANK_LOADERS[0]) for k in keys]
+    else:
+        # construct all patch names in one go as a block sequence
+        names = yaml.load("".join(f"- {k}\n" for k in keys), Loader=BANK_LOADERS[0])
+    if not all(isinstance(name, Hashable) for name in names or []):
+        # let the eager loader report the bad key
+        return None
+    return roottext, [
+        (name, key, src) for name, key, (_, src) in zip(names or [], keys, sources)
+    ]
+
+def _skip_node(events, first):
+    # returns the last event of a node, the soundfont files of presets
+    # directly inside it, and whether it uses any anchors or aliases
+    sfonts = set()
+    aliased = isinstance(first, yaml.AliasEvent) or bool(first.anchor)
+    if not isinstance(first, yaml.CollectionStartEvent):
+        return first, sfonts, aliased
+    mapping = isinstance(first, yaml.MappingStartEvent)
+    depth, n = 1, 0
+    # this loop is hot for big banks, so dispatch on exact event types
+    for e in events:
+        t = type(e)
+        if t is yaml.ScalarEvent:
+            aliased = aliased or bool(e.anchor)
+            if depth == 1:
+                if mapping and n % 2 and _is_sfpreset(e):
+                    sfonts.add(e.value.split(":")[0])
+                n += 1
+        elif t is yaml.MappingStartEvent or t is yaml.SequenceStartEvent:
+            aliased = aliased or bool(e.anchor)
+            if depth == 1:
+                n += 1
+            depth += 1
+        elif t is yaml.AliasEvent:
+            aliased = True
+            if depth == 1:
+                n += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return e, sfonts, aliased
+
+def _is_sfpreset(e):
+    if e.tag:
+        return e.tag == SFPreset.yaml_tag
+    return e.implicit[0] and SFPreset.yaml_regex.match(e.value)
+
 def _walk(node, path=(), names={}):
     if node is None:
         raise BankValidationError(
@@ -89,6 +281,9 @@ def _walk(node, path=(), names={}):
             raise(e)
         except Exception as e:
             raise BankValidationError(str(e), path)
+    elif isinstance(node, _LazyPatches):
+        for k, v in node.parsed_items():
+            _walk(v, path + (k,), names)
     elif isinstance(node, dict):
         for k, v in node.items():
             _walk(v, path + (k,), names)
@@ -96,6 +291,48 @@ def _walk(node, path=(), names={}):
         for i, v in enumerate(node):
             _walk(v, path + (i,), names)
 
+# plain scalars that can't be mistaken for other YAML syntax
+_plain = re.compile(r"(?!\.\.\.)[\w.+][\w.+\-:#/]*(?<!:)")
+_tokens = {}
+
+def _token(text):
+    # constructs a sequence grid cell or flow list item the way the
+    # bank loader would, without setting up a YAML parser for each one
+    try:
+        make, arg = _tokens[text]
+    except KeyError:
+        if len(_tokens) > 4096:
+            _tokens.clear()
+        make, arg = _tokens[text] = _scan_token(text)
+    return make(arg) if make else arg
+
+def _scan_token(text):
+    s = text.strip()
+    if _plain.fullmatch(s):
+        resolvers = BANK_LOADERS[0].yaml_implicit_resolvers
+        for tag, regexp in resolvers.get(s[0], []) + resolvers.get(None, []):
+            if regexp.match(s):
+                break
+        else:
+            return None, s
+        if tag == MidiMessage.yaml_tag:
+            return MidiMessage.from_text, s
+        if tag == SFPreset.yaml_tag:
+            return SFPreset.from_text, s
+    value = yaml.load(text, Loader=BANK_LOADERS[0])
+    if value is None or isinstance(value, (bool, int, float, str)):
+        # immutable, so the same value can be handed out every time
+        return None, value
+    return lambda text: yaml.load(text, Loader=BANK_LOADERS[0]), text
+
+
+_parkeys = {}
+
+def _shared_keys(pars):
+    # one interned tuple for each distinct set of bank object parameters
+    keys = tuple(sys.intern(k) if type(k) is str else k for k in pars)
+    return _parkeys.setdefault(keys, keys)
+
 
 class BankError(Exception):
     """Base class for all bank parsing and validation errors."""
@@ -109,10 +346,13 @@ class BankSyntaxError(BankError):
     Attributes:
       msg (str): Reason for failure
       mark (tuple): YAML mark object describing the error
+      source (tuple): ``(file, line)`` the error is in before includes
+        were expanded, if known
     """
     def __init__(self, msg):
         self.msg = msg
         self.mark = None
+        self.source = None
 
     @classmethod
     def from_yamlexc(cls, exc):
@@ -131,10 +371,32 @@ class BankSyntaxError(BankError):
             getattr(exc, "problem_mark", None) or
             None
         )
+        obj.source = None
         return obj
 
+    def map_source(self, srcmap):
+        """
+        Sets ``source`` from a source map of the expanded bank text,
+        as built by ``patcher.expand_includes``
+        """
+        if not (self.mark and srcmap):
+            return
+        if self.mark.line < len(srcmap):
+            self.source = srcmap[self.mark.line]
+        else:
+            # past the last line, e.g. at the end of the stream
+            file, line = srcmap[-1]
+            self.source = file, line + self.mark.line - len(srcmap) + 1
+
     def __str__(self):
-        if self.mark:
+        if self.source:
+            file, line = self.source
+            if file:
+                # columns are shifted by the indent of an include
+                loc = f" at line {line} of {file}"
+            else:
+                loc = f" at line {line}, column {self.mark.column}"
+        elif self.mark:
             loc = f" at line {self.mark.line}, column {self.mark.column}"
         else:
             loc = ""
@@ -180,6 +442,22 @@ class BankDumper(yaml.SafeDumper):
     pass
 
 
+if yaml.__with_libyaml__:
+    class CBankLoader(yaml.CSafeLoader):
+        """BankLoader variant using the libyaml C parser"""
+        pass
+
+    class CBankDumper(yaml.CSafeDumper):
+        """BankDumper variant using the libyaml C emitter"""
+        pass
+
+    BANK_LOADERS = [CBankLoader, BankLoader]
+    BANK_DUMPERS = [CBankDumper, BankDumper]
+else:
+    BANK_LOADERS = [BankLoader]
+    BANK_DUMPERS = [BankDumper]
+
+
 class Bank:
     """
     Parsed representation of a FluidPatcher bank YAML document.
@@ -191,17 +469,106 @@ class Bank:
         Raw dictionary of patches (unmerged).
       patches (list[str]):
         Patch names in declaration order.
-      soundfonts (list[SFPreset]):
-        Dynamic list of soundfont files required by patches.
+      soundfonts (set[str]):
+        Soundfont files required by the root and all patches.
+
+    In lazy mode, the root section and the list of patch names are
+    parsed up front, but each patch is only constructed and validated
+    the first time it is accessed. Errors in a patch are then raised on
+    access instead of at load time.
     """
-    def __init__(self, text):
-        try:
-            self.root = yaml.load(text, Loader=BankLoader)
-        except yaml.YAMLError as e:
-            raise BankSyntaxError.from_yamlexc(e)
+    def __init__(self, text, lazy=False):
+        self.root = _load(text, lazy)
         self.patch = self.root.setdefault("patches", {})
-        names = self.root.get("names", {})
+        names = _scoped(self.root.get("names", {}))
         _walk(self.root, path=(), names=names)
+        self._sources = {}
+        self.reindex()
+
+    def reparse(self, text):
+        """
+        Parse an edited version of this bank, reusing the patches whose
+        source text hasn't changed.
+
+        Args:
+          text (str): YAML text of the edited bank
+
+        Returns:
+          (Bank): a new bank. Only the root section and the patches that
+          changed are constructed and validated, unless ``names`` changed,
+          in which case every patch is validated again. Banks that use
+          anchors or aliases are always parsed in full.
+        """
+        if (loaded := _load_incremental(text, self._sources)) is None:
+            return Bank(text)
+        bank = Bank.__new__(Bank)
+        bank.root, bank._sources = loaded
+        bank.patch = bank.root["patches"]
+        bank.reindex()
+        return bank
+
+    def map_zones(self, func):
+        """
+        Calls ``func`` on the root and every patch, including patches
+        of a lazy bank when they are parsed later
+        """
+        func(self.root)
+        if isinstance(self.patch, _LazyPatches):
+            for _, zone in self.patch.parsed_items():
+                func(zone)
+            self.patch.prepare = func
+        else:
+            for zone in self.patch.values():
+                func(zone)
+        self.reindex()
+
+    def uses(self, name=None):
+        """
+        Returns the files a patch needs, or that the whole bank needs.
+
+        Looked up in an index that is kept up to date as patches are
+        added, replaced or removed, so it doesn't walk the bank.
+
+        Args:
+          name (str): Patch name, or ``None`` for the root and all patches
+
+        Returns:
+          (dict[str, set]): Soundfont, MIDI file and LADSPA library paths,
+          keyed by ``soundfonts``, ``midifiles`` and ``ladspafx``. For a
+          patch, root-level soundfonts and players it overrides are left
+          out. For the whole bank, the MIDI files and LADSPA libraries of
+          lazy patches that haven't been parsed yet are not included.
+        """
+        if name is not None:
+            self.patch[name] # parses a lazy patch
+        self._sync()
+        root = _zone_uses(self.root)
+        if name is not None:
+            patch = self._uses[name][1]
+            return {kind: set((root[kind] | patch[kind]).values()) for kind in root}
+        return {
+            kind: set(root[kind].values()) | set(self._refs[kind])
+            for kind in root
+        }
+
+    def reindex(self, name=None):
+        """
+        Updates the file index after a patch was edited in place.
+
+        Adding, replacing or removing whole patches is picked up
+        automatically, but changing presets, MIDI files or LADSPA effects
+        inside an existing patch dict is not. ``FluidPatcher.apply_patch()``
+        reindexes the patch it applies, so this is only needed to read
+        ``uses()`` or ``soundfonts`` after such an edit.
+
+        Args:
+          name (str): Patch name, or ``None`` to rebuild the whole index
+        """
+        if name is None:
+            self._uses, self._refs = {}, {kind: {} for kind in _ZONE_USES}
+        elif name in self._uses:
+            self._untrack(name)
+        self._sync()
 
     @property
     def patches(self):
@@ -209,21 +576,21 @@ class Bank:
 
     @property
     def soundfonts(self):
-        sfonts = set()
-        for zone in self:
-            for item in zone.values():
-                if isinstance(item, SFPreset):
-                    sfonts.add(item.file)
-        return sfonts
+        return self.uses()["soundfonts"]
 
     def __getitem__(self, name):
         return _Patch(self.root, self.patch[name])
 
     def __setitem__(self, name, p):
         self.patch[name] = p
+        if name in self._uses:
+            self._untrack(name)
+        self._track(name, p)
 
     def __delitem__(self, name):
         del self.patch[name]
+        if name in self._uses:
+            self._untrack(name)
 
     def __contains__(self, name):
         return name in self.patch
@@ -235,8 +602,135 @@ class Bank:
         return iter([self.root, *self.patch.values()])
 
     def dump(self):
-        bank = self.root | {"patches": self.patch}
-        return yaml.dump(bank, Dumper=BankDumper, sort_keys=False)
+        bank = self.root | {"patches": dict(self.patch.items())}
+        return yaml.dump(bank, Dumper=BANK_DUMPERS[0], sort_keys=False)
+
+    def _sync(self):
+        # pick up patches that were added, replaced or removed by editing
+        # the patch dict directly, comparing only the patch objects
+        for name in [n for n in self._uses if n not in self.patch]:
+            self._untrack(name)
+        for name, zone in dict.items(self.patch):
+            if name not in self._uses or self._uses[name][0] is not zone:
+                if name in self._uses:
+                    self._untrack(name)
+                self._track(name, zone)
+
+    def _track(self, name, zone):
+        uses = _zone_uses(zone)
+        self._uses[name] = zone, uses
+        for kind, refs in self._refs.items():
+            for path in uses[kind].values():
+                refs[path] = refs.get(path, 0) + 1
+
+    def _untrack(self, name):
+        _, uses = self._uses.pop(name)
+        for kind, refs in self._refs.items():
+            for path in uses[kind].values():
+                refs[path] -= 1
+                if refs[path] == 0:
+                    del refs[path]
+
+
+_ZONE_USES = "soundfonts", "midifiles", "ladspafx"
+
+def _zone_uses(zone):
+    # soundfont files by channel and player/effect paths by name, so that
+    # patch entries can override root entries when merged
+    if isinstance(zone, _Unparsed):
+        return {"soundfonts": {sf: sf for sf in zone.sfonts}, "midifiles": {}, "ladspafx": {}}
+    return {
+        "soundfonts": {
+            chan: item.file for chan, item in zone.items()
+            if isinstance(item, SFPreset)
+        },
+        "midifiles": {
+            name: midi.file for name, midi in zone.get("midifiles", {}).items()
+            if hasattr(midi, "file")
+        },
+        "ladspafx": {
+            name: fx.lib for name, fx in zone.get("ladspafx", {}).items()
+            if hasattr(fx, "lib")
+        },
+    }
+
+
+class _Unparsed:
+    """Source text of a patch in a lazy bank that hasn't been parsed yet"""
+
+    def __init__(self, text, line, sfonts):
+        self.text = text
+        self.line = line
+        self.sfonts = sfonts
+
+    def load(self):
+        # pad with newlines so error marks give the line in the bank
+        return _load("\n" * self.line + self.text)
+
+
+class _LazyPatches(dict):
+    """
+    Patch mapping of a lazy bank. Keys and order are known up front,
+    values are parsed and validated when first retrieved.
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+        self.prepare = None
+
+    def add(self, name, patch):
+        dict.__setitem__(self, name, patch)
+
+    def parsed_items(self):
+        return [(k, v) for k, v in dict.items(self) if not isinstance(v, _Unparsed)]
+
+    def _parse(self, name, src):
+        patch = src.load()
+        path = ("patches", name)
+        _walk(patch, path, _scoped(self.root.get("names", {})))
+        if self.prepare:
+            self.prepare(patch)
+        dict.__setitem__(self, name, patch)
+        return patch
+
+    def __getitem__(self, name):
+        patch = dict.__getitem__(self, name)
+        if isinstance(patch, _Unparsed):
+            patch = self._parse(name, patch)
+        return patch
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def pop(self, name, *default):
+        if name in self:
+            patch = self[name]
+            del self[name]
+            return patch
+        return dict.pop(self, name, *default)
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self.add(name, default)
+        return self[name]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        # pickle unparsed patches as-is instead of parsing them
+        state = {"root": self.root, "prepare": None}
+        return (self.__class__, (None,), state, None, iter(dict.items(self)))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
 
 
 class _Patch:
@@ -277,7 +771,7 @@ class SFPreset(yaml.YAMLObject):
       prog (int): Program index
     """
     yaml_tag = "!sfpreset"
-    yaml_loader = BankLoader
+    yaml_loader = BANK_LOADERS
     yaml_dumper = BankDumper
     yaml_regex = re.compile(r"^(.+\.sf2):(\d+):(\d+)$", flags=re.I)
     zone = None
@@ -289,7 +783,11 @@ class SFPreset(yaml.YAMLObject):
 
     @classmethod
     def from_yaml(cls, loader, node):
-        return cls(*loader.construct_scalar(node).split(":"))
+        return cls.from_text(loader.construct_scalar(node))
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(*text.split(":"))
 
     @classmethod
     def to_yaml(cls, dumper, data):
@@ -310,14 +808,19 @@ class MidiMessage(yaml.YAMLObject):
       val (int): Value (velocity, CC value, pitch bend, etc.)
     """
     yaml_tag = "!midimsg"
-    yaml_loader = BankLoader
+    yaml_loader = BANK_LOADERS
     yaml_dumper = BankDumper
     yaml_regex = re.compile(rf"^({'|'.join(TYPE_ALIAS)}):\S*$")
     zone = "messages"
     zone_type = list
+    # banks can hold many thousands of messages, so no instance dicts
+    __slots__ = "type", "chan", "num", "val", "_text"
 
     def __init__(self, **pars):
-        self.__dict__.update(pars)
+        for par, val in pars.items():
+            if par not in self.__slots__:
+                raise BankValidationError(f"MidiMessage has no parameter '{par}'")
+            setattr(self, par, val)
         if "_text" not in pars:
             match pars:
                 case {"type": "sysex", "val": data}:
@@ -332,7 +835,10 @@ class MidiMessage(yaml.YAMLObject):
 
     @classmethod
     def from_yaml(cls, loader, node):
-        text = loader.construct_scalar(node)
+        return cls.from_text(loader.construct_scalar(node))
+
+    @classmethod
+    def from_text(cls, text):
         match [x for x in text.split(":") if x]:
             case ["sysex", *data]:
                 pars = dict(type="sysex", val=data)
@@ -341,11 +847,12 @@ class MidiMessage(yaml.YAMLObject):
             case [type, chan, val]:
                 pars = dict(type=type, chan=chan, val=val)
             case [type]:
-                pars = dict(type=type, _text=text)
+                pars = dict(type=type)
         obj = cls.__new__(cls)
-        obj.__dict__.update(pars)
-        obj._pars = pars
-        obj._text = text
+        for par, val in pars.items():
+            setattr(obj, par, val)
+        # the same message often appears many times, e.g. in sequences
+        obj._text = sys.intern(text)
         return obj
         
     @classmethod
@@ -353,7 +860,10 @@ class MidiMessage(yaml.YAMLObject):
         return dumper.represent_scalar(cls.yaml_tag, str(data))
             
     def copy(self, **pars):
-        return MidiMessage(**self.__dict__ | pars)
+        for par in "type", "chan", "num", "val":
+            if hasattr(self, par):
+                pars.setdefault(par, getattr(self, par))
+        return MidiMessage(**pars)
 
     def _validate(self, path=(), names={}):
         if not hasattr(self, "type"):
@@ -374,14 +884,14 @@ class _FlowList(list, yaml.YAMLObject):
     Compact list style with round-trip formatting
     """
     yaml_tag = "!flowlist"
-    yaml_loader = BankLoader
+    yaml_loader = BANK_LOADERS
     yaml_dumper = BankDumper
     yaml_regex = re.compile(r".*?,")
 
     @classmethod
     def from_yaml(cls, loader, node):
         text = loader.construct_scalar(node)
-        obj = cls([yaml.load(e, Loader=BankLoader) for e in text.split(",")])
+        obj = cls([_token(e) for e in text.split(",")])
         obj._text = text
         return obj
 
@@ -398,7 +908,8 @@ class _BankObject(yaml.YAMLObject):
     Base class for tagged structured YAML objects inside a patch.
 
     Provides:
-      - Storage for raw parameters as written in YAML (``_pars``)
+      - Storage for raw parameters as written in YAML (``_pars``), kept
+        as a key tuple shared between objects and a tuple of values
       - Automatic deep construction of nested data
       - Validation via ``_validate``
       - Common copy/duplication support
@@ -406,7 +917,7 @@ class _BankObject(yaml.YAMLObject):
     Subclasses define meaning, required keys, and placement
     (e.g., rules, sequences, arpeggios, etc.).
     """
-    yaml_loader = BankLoader
+    yaml_loader = BANK_LOADERS
     yaml_dumper = BankDumper
 
     def __init__(self, **pars):
@@ -429,8 +940,13 @@ class _BankObject(yaml.YAMLObject):
         )
 
     def _init_pars(self, pars):
-        self.__dict__.update(pars)
-        self._pars = pars
+        keys = _shared_keys(pars)
+        self.__dict__.update(zip(keys, pars.values()))
+        self._parkeys, self._parvals = keys, tuple(pars.values())
+
+    @property
+    def _pars(self):
+        return dict(zip(self._parkeys, self._parvals))
 
     def copy(self, **pars):
         for k, v in self.__dict__.items():
@@ -483,17 +999,26 @@ class MidiRule(_BankObject):
                     )
             self.type = TYPE_ALIAS[types[0]]
             self.totype = TYPE_ALIAS[types[-1]]
+        routes = names.routes if isinstance(names, _Names) else {}
         for par in "chan", "num", "val":
             spec = str(getattr(self, par, ""))
-            if (m := self.ftroute.match(spec)) and any(m.groups()):
-                min, max, tomin, tomax = [resolve(x, names) for x in m.groups()]
-                setattr(self, par, Route.from_ranges(min, max, tomin, tomax))
-            elif m := self.maroute.match(spec):
-                min, max, mul, add = [resolve(x, names) for x in m.groups()]
-                setattr(self, par, Route.from_affine(min, max, mul, add))
+            if spec not in routes:
+                routes[spec] = self._route_args(spec, names)
+            if route := routes[spec]:
+                make, args = route
+                setattr(self, par, make(*args))
         if hasattr(self, "lsb"):
             self.lsb = resolve(self.lsb, names)
 
+    @classmethod
+    def _route_args(cls, spec, names):
+        # constructor and resolved arguments of the Route for a spec
+        if (m := cls.ftroute.match(spec)) and any(m.groups()):
+            return Route.from_ranges, [resolve(x, names) for x in m.groups()]
+        elif m := cls.maroute.match(spec):
+            return Route.from_affine, [resolve(x, names) for x in m.groups()]
+        return None
+
     def __str__(self):
         return ", ".join([f"{k}: {v}" for k, v in self._pars.items()])
 
@@ -510,6 +1035,8 @@ class Route:
       tomin (int|float): minimum of target range for values
       tomax (int|float): maximum of target range for values
     """
+    __slots__ = "min", "max", "mul", "add", "tomin", "tomax"
+
     def __init__(self, min, max, mul, add):
         self.min = min
         self.max = max
@@ -555,10 +1082,14 @@ class Route:
         """
         return cls(min, max, mul, add)
 
+    @property
+    def tovals(self):
+        """range: Integer target values covered by the route"""
+        return range(int(self.tomin), int(self.tomax) + 1)
+
     def __iter__(self):
-        tovals = range(int(self.tomin), int(self.tomax) + 1)
         return iter(
-            Route.from_ranges(self.min, self.max, n, n) for n in tovals
+            Route.from_ranges(self.min, self.max, n, n) for n in self.tovals
         )
 
 
@@ -583,8 +1114,7 @@ class Sequence(_BankObject):
         if "\n" in getattr(self, "events", ""):
             events = []
             for p in self.events.strip().split("\n\n"):
-                s = [[yaml.load(e, Loader=BankLoader) for e in r.split()]
-                     for r in p.splitlines()]
+                s = [[_token(e) for e in r.split()] for r in p.splitlines()]
                 events.append([list(t) for t in zip(*s)])
             self.events = events
 
@@ -723,16 +1253,20 @@ def str_presenter(dumper, data):
         return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
     return dumper.represent_scalar("tag:yaml.org,2002:str", data)
 
-yaml.add_representer(str, str_presenter, Dumper=BankDumper)
+for dumper in BANK_DUMPERS:
+    yaml.add_representer(str, str_presenter, Dumper=dumper)
 
 for cls in (SFPreset, MidiMessage, _FlowList):
-    BankLoader.add_implicit_resolver(cls.yaml_tag, cls.yaml_regex, None)
-    BankDumper.add_implicit_resolver(cls.yaml_tag, cls.yaml_regex, None)
+    for resolver in BANK_LOADERS + BANK_DUMPERS:
+        resolver.add_implicit_resolver(cls.yaml_tag, cls.yaml_regex, None)
+    for dumper in BANK_DUMPERS[:-1]:
+        dumper.add_representer(cls, cls.to_yaml)
 
 for cls in _BankObject.__subclasses__():
     path = ["patches", (dict, None), cls.zone, (cls.zone_type, None)]
-    BankLoader.add_path_resolver(cls.yaml_tag, path, dict)
-    BankDumper.add_path_resolver(cls.yaml_tag, path, dict)
-    BankLoader.add_path_resolver(cls.yaml_tag, path[2:], dict)
-    BankDumper.add_path_resolver(cls.yaml_tag, path[2:], dict)
+    for resolver in BANK_LOADERS + BANK_DUMPERS:
+        resolver.add_path_resolver(cls.yaml_tag, path, dict)
+        resolver.add_path_resolver(cls.yaml_tag, path[2:], dict)
+    for dumper in BANK_DUMPERS[:-1]:
+        dumper.add_representer(cls, cls.to_yaml)
 
@@ -2,15 +2,16 @@
 Configuration loading and initialization for fluidpatcher.
 
 This module defines where fluidpatcher stores its configuration data
-(~/.config/fluidpatcher/... by default), loads settings on import,
-creates missing directories, and populates them with bundled defaults
-when needed.
+(~/.config/fluidpatcher/... by default) and loads settings on import.
+Creating the config file and missing directories, populating them with
+bundled defaults and looking for a patchcord build are left to
+``setup()``, which runs when the first FluidPatcher is created.
 
 At runtime:
 - CONFIG holds the merged configuration mapping
 - CONFIG_PATH stores the config file path
 - PATCHCORD resolves to a LADSPA plugin .so suitable for this machine,
-  or None if no build is available
+  or None if no build is available (computed on first access)
 """
 import importlib.resources as res
 import os
@@ -38,6 +39,32 @@ def save_config():
     )
 
 
+def save_setting(key, val):
+    """
+    Sets one top-level key in CONFIG and the config file, leaving the
+    rest of the file as the user wrote it.
+    """
+    CONFIG[key] = val
+    if isinstance(val, Path):
+        val = val.as_posix()
+    lines = []
+    if CONFIG_PATH.exists():
+        # drop the key's old entry, including any nested lines under it
+        skip = False
+        for line in CONFIG_PATH.read_text().splitlines(keepends=True):
+            if line.startswith(f"{key}:"):
+                skip = True
+            elif not line[:1].isspace():
+                skip = False
+            if not skip:
+                lines.append(line)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    lines.append(yaml.safe_dump({key: val}, sort_keys=False))
+    CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    CONFIG_PATH.write_text("".join(lines))
+
+
 DEFAULT_CFG = """\
 fluidsettings:
   midi.autoconnect: 1
@@ -53,7 +80,7 @@ CONFIG_PATH = Path(os.getenv(
 
 # load configuration
 CONFIG = yaml.safe_load(DEFAULT_CFG)
-if CONFIG_PATH.exists:
+if CONFIG_PATH.exists():
     cfg = yaml.safe_load(CONFIG_PATH.read_text())
     CONFIG.update(cfg)
 
@@ -63,32 +90,46 @@ for key, val in list(CONFIG.items()):
 CONFIG.setdefault("banks_path", CONFIG_PATH.parent / "banks")
 CONFIG.setdefault("sounds_path", CONFIG["banks_path"].parent / "sounds")
 CONFIG.setdefault("midi_path", CONFIG["banks_path"].parent / "midi")
+CONFIG.setdefault("cache_path", CONFIG["banks_path"].parent / "cache")
 CONFIG.setdefault(
     "ladspa_path",
     Path(os.getenv("LADSPA_PATH", "/usr/lib/ladspa"))
 )
 
-# create default files as needed
-if not CONFIG_PATH.exists():
-    save_config()
-if not CONFIG["banks_path"].exists():
-    shutil.copytree(res.files("fluidpatcher.data") / "banks", CONFIG["banks_path"])
-if not CONFIG["sounds_path"].exists():
-    shutil.copytree(res.files("fluidpatcher.data") / "sounds", CONFIG["sounds_path"])
-if not CONFIG["midi_path"].exists():
-    shutil.copytree(res.files("fluidpatcher.data") / "midi", CONFIG["midi_path"])
-
-# initialize patchcord for multi-channel LADSPA mixing
-system = platform.system().lower()
-arch = platform.machine()
-prebuilt_path = res.files("fluidpatcher._ladspa") / f"prebuilt/{system}-{arch}/patchcord.so"
-patchcord = res.files("fluidpatcher._ladspa") / "patchcord.so"
-
-if patchcord.exists():
-    PATCHCORD = {"_patchcord": LadspaEffect(lib=patchcord)}
-elif prebuilt_path.exists():
-    PATCHCORD = {"_patchcord": LadspaEffect(lib=prebuilt_path)}
-else:
-    PATCHCORD = {}
-    CONFIG["fluidsettings"]["synth.audio-groups"] = 1
 
+def setup():
+    """
+    Creates the config file and default folders if they're missing,
+    and finds a patchcord build for this machine. Only does anything
+    the first time it's called.
+    """
+    global PATCHCORD
+    if "PATCHCORD" in globals():
+        return
+    # create default files as needed
+    if not CONFIG_PATH.exists():
+        save_config()
+    for key in "banks", "sounds", "midi":
+        if not CONFIG[f"{key}_path"].exists():
+            shutil.copytree(res.files("fluidpatcher.data") / key, CONFIG[f"{key}_path"])
+
+    # initialize patchcord for multi-channel LADSPA mixing
+    system = platform.system().lower()
+    arch = platform.machine()
+    prebuilt_path = res.files("fluidpatcher._ladspa") / f"prebuilt/{system}-{arch}/patchcord.so"
+    patchcord = res.files("fluidpatcher._ladspa") / "patchcord.so"
+
+    if patchcord.exists():
+        PATCHCORD = {"_patchcord": LadspaEffect(lib=patchcord)}
+    elif prebuilt_path.exists():
+        PATCHCORD = {"_patchcord": LadspaEffect(lib=prebuilt_path)}
+    else:
+        PATCHCORD = {}
+        CONFIG["fluidsettings"]["synth.audio-groups"] = 1
+
+
+def __getattr__(name):
+    if name == "PATCHCORD":
+        setup()
+        return PATCHCORD
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
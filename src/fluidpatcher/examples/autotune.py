@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Finds the FluidSynth settings that give the lowest safe latency.
+
+Renders a patch playing a MIDI file offline with each combination of
+``synth.cpu-cores``, ``synth.polyphony`` and ``audio.period-size``,
+timing every audio period. A setup is latency-safe if even the slowest
+period renders well within the time the sound card's buffer of
+``audio.periods`` periods gives it. The safe setup with the lowest
+latency wins - then the one with most polyphony, then the one that
+loads the CPU least - and is added to the ``fluidsettings`` in the
+config file.
+
+Run it on the machine that will play the bank, with nothing else busy:
+
+    python -m fluidpatcher.examples.autotune mybank.yaml "Big Strings" song.mid
+"""
+
+import argparse
+from itertools import product
+import os
+import time
+
+import yaml
+
+from fluidpatcher import FluidPatcher, CONFIG, config
+
+CPU_CORES = sorted({1, 2, 4, os.cpu_count() or 1})
+POLYPHONY = 64, 128, 256
+PERIOD_SIZES = 64, 128, 256, 512
+PERIODS = 2, 3, 4
+# fraction of the buffered time a period may take to render
+SAFETY = 0.7
+
+
+def measure(bankfile, patch, midifile, seconds, cores, polyphony, period_size):
+    fp = FluidPatcher(
+        fluidsettings={"synth.cpu-cores": cores, "synth.polyphony": polyphony},
+        fluidlog=-1,
+        offline=True,
+    )
+    try:
+        fp.load_bank(bankfile)
+        fp.apply_patch(patch or fp.bank.patches[0])
+        rate = fp.fluidsetting("synth.sample-rate")
+        blocktimes = []
+        wall, cpu = time.perf_counter(), time.process_time()
+        fp.render(seconds, midifile=midifile, blocksize=period_size, blocktimes=blocktimes)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        # free the engine, so it doesn't slow down the setups after it
+        fp.close()
+    # partial blocks at the end don't say anything about a full period
+    worst = max((t for n, t in blocktimes if n == period_size), default=None)
+    if worst is None:
+        return None
+    return {
+        "realtime": seconds / wall,
+        "cpu": cpu / seconds, # CPU seconds per second of audio
+        "worst": worst,
+        "period": period_size / rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("bankfile", nargs="?", default="testbank.yaml")
+    parser.add_argument("patch", nargs="?", help="patch to play (default: the first)")
+    parser.add_argument("midifile", nargs="?", default="funkjam.mid")
+    parser.add_argument("--seconds", type=float, default=20, help="audio to render per setup")
+    parser.add_argument("--dry-run", action="store_true", help="don't save the result")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'cores':>5} {'poly':>5} {'period':>6}  {'speed':>7} {'cpu':>5} {'worst':>8}")
+    for cores, polyphony, period_size in product(CPU_CORES, POLYPHONY, PERIOD_SIZES):
+        r = measure(
+            args.bankfile, args.patch, args.midifile, args.seconds,
+            cores, polyphony, period_size,
+        )
+        if r is None:
+            print(f"{cores:5} {polyphony:5} {period_size:6}  --seconds too short for a full period")
+            continue
+        print(
+            f"{cores:5} {polyphony:5} {period_size:6}  {r['realtime']:6.1f}x"
+            f" {r['cpu']:5.2f} {1000 * r['worst']:6.2f}ms"
+        )
+        # periods doesn't change how audio is rendered, only how long the
+        # driver can wait for it, so it is judged from the same timings
+        for periods in PERIODS:
+            if r["worst"] <= SAFETY * (periods - 1) * r["period"]:
+                results.append((
+                    periods * r["period"], -polyphony, r["cpu"],
+                    {
+                        "synth.cpu-cores": cores,
+                        "synth.polyphony": polyphony,
+                        "audio.period-size": period_size,
+                        "audio.periods": periods,
+                    },
+                ))
+    if not results:
+        print("No setup renders fast enough - try a lighter patch or MIDI file.")
+        return
+    latency, _, _, best = min(results, key=lambda r: r[:3])
+    print(f"\nBest: {best} ({1000 * latency:.1f} ms latency)")
+    if not args.dry_run:
+        # merge into the settings in the file, not the runtime CONFIG,
+        # which also holds overrides made for this machine at startup
+        saved = {}
+        if config.CONFIG_PATH.exists():
+            cfg = yaml.safe_load(config.CONFIG_PATH.read_text()) or {}
+            saved = cfg.get("fluidsettings") or {}
+        runtime = CONFIG.get("fluidsettings", {}) | best
+        config.save_setting("fluidsettings", saved | best)
+        CONFIG["fluidsettings"] = runtime
+        print("Saved to config.")
+
+
+if __name__ == "__main__":
+    main()
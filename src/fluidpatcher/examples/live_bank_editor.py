@@ -7,11 +7,19 @@ are added to the Patch menu, and can be applied to audition changes
 to the bank. Bank errors are shown in the status bar and dumped to
 stdout while editing - this is diagnostic and non-breaking.
 
+Parsing runs in a background thread so large banks don't stall the
+UI. Only patches whose text changed are parsed again, and edits made
+while a parse is running replace any that are still waiting.
+The bank is hot-reloaded, so players and effects of the current
+patch keep running unless the edit changes them.
+
 Note: this editor can be used alongside a DAW.
 Connect MIDI/audio to fluidsynth.
 """
 
 from pathlib import Path
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog
 import traceback
@@ -19,7 +27,8 @@ import traceback
 from yaml import YAMLError
 
 import fluidpatcher
-from fluidpatcher.bankfiles import BankSyntaxError, BankValidationError
+from fluidpatcher.bankfiles import Bank, BankSyntaxError, BankValidationError
+from fluidpatcher.patcher import expand_includes
 
 BANKS_PATH = fluidpatcher.CONFIG["banks_path"]
 
@@ -30,6 +39,11 @@ class BankEditorApp(tk.Tk):
         self.geometry("900x600")
         self.lastfile = ""
         self._parse_after_id = None
+        self._parse_id = 0
+        self._parse_request = None
+        self._parse_ready = threading.Condition()
+        self._parse_results = queue.SimpleQueue()
+        threading.Thread(target=self._parse_worker, daemon=True).start()
 
         # create menus
         menubar = tk.Menu(self)
@@ -81,6 +95,7 @@ class BankEditorApp(tk.Tk):
         self.text.bind("<<Modified>>", self._on_text_modified)
         self.text.bind("<KeyRelease>", self._update_cursor_pos)
         self.text.bind("<ButtonRelease>", self._update_cursor_pos)
+        self.after(50, self._poll_parse_results)
 
     def open_file(self):
         f = filedialog.askopenfilename(
@@ -121,20 +136,53 @@ class BankEditorApp(tk.Tk):
 
     def parse_bank(self):
         self._parse_after_id = None
-        text = self.text.get("1.0", "end-1c")
+        with self._parse_ready:
+            self._parse_id += 1
+            self._parse_request = self._parse_id, self.text.get("1.0", "end-1c")
+            self._parse_ready.notify()
+
+    def _parse_worker(self):
+        # keeps the last good bank so only the changed patches are parsed,
+        # and skips straight to the newest text if several edits queue up
+        bank = None
+        while True:
+            with self._parse_ready:
+                while self._parse_request is None:
+                    self._parse_ready.wait()
+                parse_id, text = self._parse_request
+                self._parse_request = None
+            srcmap = []
+            try:
+                raw = expand_includes(raw=text, srcmap=srcmap)
+                result = bank.reparse(raw) if bank else Bank(raw)
+            except Exception as e:
+                if isinstance(e, BankSyntaxError):
+                    e.map_source(srcmap)
+                result = e
+            else:
+                bank = result
+            self._parse_results.put((parse_id, result))
+
+    def _poll_parse_results(self):
+        try:
+            while True:
+                parse_id, result = self._parse_results.get_nowait()
+                if parse_id == self._parse_id:
+                    self.show_parse_result(result)
+        except queue.Empty:
+            pass
+        self.after(50, self._poll_parse_results)
+
+    def show_parse_result(self, result):
         try:
-            fp.load_bank(raw=text)
+            if isinstance(result, Exception):
+                raise result
+            fp.load_bank(raw=result, hot=True)
         except Exception as e:
-            if isinstance(e, BankSyntaxError) and e.mark:
-                buflines = e.mark.buffer.splitlines()
-                for i, line in enumerate(text.splitlines()):
-                    if line in buflines:
-                        if buflines.index(line) == e.mark.line:
-                            break
-                        if buflines.index(line) > e.mark.line:
-                            i -= 1
-                            break
-                self.set_status(f"{type(e).__name__}: {e.msg} on line {i + 1}")
+            if isinstance(e, BankSyntaxError) and e.source:
+                file, line = e.source
+                where = f"line {line + 1}" + (f" of {file}" if file else "")
+                self.set_status(f"{type(e).__name__}: {e.msg} on {where}")
             else:
                 self.set_status(f"{type(e).__name__}: {e}")
             traceback.print_exception(type(e), e, e.__traceback__)
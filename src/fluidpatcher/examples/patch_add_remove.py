@@ -74,6 +74,8 @@ while True:
                 fp.bank.patch[name][MIDI_CHANNEL] = SFPreset(
                     soundfont.file, bank, prog
                 )
+                # update the bank's index of files used by patches
+                fp.bank.reindex(name)
             else:
                 print("Preset number out of range")
 
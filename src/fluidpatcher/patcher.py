@@ -11,13 +11,17 @@ engine and Bank files. It handles:
 """
 
 from contextlib import contextmanager
+import io
 from pathlib import Path
+import threading
+import time
 
 from yaml import safe_load, safe_dump
 
-from .bankfiles import Bank, SFPreset, MidiMessage
-from .bankfiles import BankValidationError
-from .config import CONFIG, PATCHCORD
+from . import bankcache, config, pfluidsynth, render
+from .bankfiles import Bank, SFPreset, MidiFile, MidiMessage
+from .bankfiles import BankSyntaxError, BankValidationError
+from .config import CONFIG
 from .pfluidsynth import Synth, PLAYER_TYPES
 from .router import Router
 
@@ -42,6 +46,126 @@ SYNTH_DEFAULTS = {"synth.chorus.active": 1, "synth.reverb.active": 1,
                   "synth.gain": 0.2}
 
 
+def _changed(old, new):
+    # bank objects repr as the YAML parameters they were parsed from
+    return old is not new and repr(old) != repr(new)
+
+
+_include_cache = {}
+
+def _read_lines(path):
+    # files are only read again when their mtime or size changes, and
+    # are fingerprinted from the very bytes that get parsed
+    stat = path.stat()
+    key = stat.st_mtime_ns, stat.st_size
+    cached = _include_cache.get(path)
+    if cached is None or cached[0] != key:
+        data = path.read_bytes()
+        text = io.TextIOWrapper(io.BytesIO(data)).read() # as read_text() decodes
+        cached = _include_cache[path] = (
+            key,
+            bankcache.fingerprint(path, stat.st_mtime_ns, data),
+            text.splitlines(keepends=True),
+        )
+    return cached[1:]
+
+def expand_includes(bankfile="", raw="", sources=None, srcmap=None):
+    """
+    Replace the ``#include`` directives in a bank with the contents of
+    the included files.
+
+    Args:
+      bankfile (str|Path):
+        Filename relative to CONFIG["banks_path"], or absolute.
+
+      raw (str):
+        YAML text to expand instead of reading ``bankfile``.
+
+      sources (list):
+        If given, a ``bankcache.fingerprint()`` of each file read is
+        appended to it.
+
+      srcmap (list):
+        If given, a ``(file, line)`` pair is appended for each line of
+        the expanded text, naming the file (``None`` for ``raw``) and
+        zero-based line it came from.
+
+    Returns:
+      (str): the expanded YAML text.
+    """
+    out = []
+    newline = True
+    def read(f):
+        path = CONFIG["banks_path"] / f
+        try:
+            fingerprint, lines = _read_lines(path)
+        except FileNotFoundError as e:
+            raise BankValidationError(f"No such file {f}")
+        if sources is not None:
+            sources.append(fingerprint)
+        return lines
+    def expand(files, lines, pad="", first=None):
+        nonlocal newline
+        name = files[-1] if files else None
+        start = 0
+        for n in [n for n, line in enumerate(lines) if "#include" in line] + [None]:
+            if n is not None:
+                i = lines[n].index("#include")
+                f = lines[n][i + 9:].rstrip()
+                if f in files:
+                    continue
+            # copy the lines up to the next directive in one go
+            if chunk := lines[start:n]:
+                if srcmap is not None:
+                    end = len(lines) if n is None else n
+                    srcmap.extend((name, k) for k in range(start + (not newline), end))
+                if start == 0 and first is not None:
+                    out.append(first + chunk[0])
+                    chunk = chunk[1:]
+                out.extend([pad + line for line in chunk] if pad else chunk)
+                newline = out[-1].endswith(("\n", "\r"))
+            if n is None:
+                break
+            prefix = first if n == 0 and first is not None else pad
+            if lines[n][:i].isspace():
+                expand(files + [f], read(f), prefix + lines[n][:i])
+            else:
+                expand(files + [f], read(f), pad, prefix + lines[n][:i])
+            start = n + 1
+    if bankfile:
+        expand([bankfile], read(bankfile))
+    else:
+        expand([], raw.splitlines(keepends=True))
+    return "".join(out)
+
+
+class _RoutedMessage:
+    # a MidiMessage as the router expects incoming events
+
+    def __init__(self, msg):
+        for par in "type", "chan", "num", "val":
+            if hasattr(msg, par):
+                setattr(self, par, getattr(msg, par))
+
+
+# seconds between gain steps when fading out a switched-away engine
+FADE_STEP = 0.01
+
+
+def _retire(synth, router, fade):
+    # fade out an engine that was switched away from, then delete it,
+    # which frees the soundfonts no other synth uses - the router is
+    # passed along so its sequencer client stays alive until then
+    gain = synth["synth.gain"]
+    steps = int(fade / FADE_STEP)
+    for i in range(steps):
+        synth["synth.gain"] = gain * (1 - (i + 1) / steps)
+        time.sleep(FADE_STEP)
+    if router.coalescer:
+        router.coalescer.dismiss()
+    synth.delete()
+
+
 class FluidPatcher:
     """
     High-level controller FluidSynth. Applies descriptive YAML-based
@@ -55,7 +179,7 @@ class FluidPatcher:
         Mapping of loaded soundfonts, keyed by file path.                  
     """
 
-    def __init__(self, fluidsettings={}, fluidlog=None):
+    def __init__(self, fluidsettings={}, fluidlog=None, offline=False, shards=1, midi=True):
         """
         Create a FluidPatcher and start FluidSynth.
 
@@ -65,27 +189,120 @@ class FluidPatcher:
 
           fluidlog (callable | -1 | None):
             Callback accepting (level, message) or -1 to suppress logs.
+
+          offline (bool):
+            Don't start audio or MIDI drivers. Audio is produced by
+            calling ``render()`` instead, so no sound card is needed.
+
+          shards (int):
+            Number of worker processes to play voices in, each
+            rendering a share of the MIDI channels on its own CPU
+            core. Needs ``offline=True``.
+
+          midi (bool):
+            Start a MIDI driver. Without one, MIDI only arrives through
+            ``send_midimessage()`` and ``render()``.
         """
+        t = time.perf_counter()
+        config.setup()
+        configured = time.perf_counter()
+        pfluidsynth.load_library(CONFIG.get("libfluidsynth_path"))
+        if (
+            pfluidsynth.library_searched
+            and CONFIG.get("libfluidsynth_path") != Path(pfluidsynth.library_path)
+        ):
+            # remember where the library was found to skip the search next time
+            config.save_setting("libfluidsynth_path", Path(pfluidsynth.library_path))
+        if pfluidsynth.sfont_registry.owner is None:
+            pfluidsynth.sfont_registry.mmap = CONFIG.get("mmap_soundfonts", False)
+        self._options = dict(
+            fluidsettings=fluidsettings, fluidlog=fluidlog, offline=offline, shards=shards
+        )
+        self._standby = None
+        self._switch_times = {}
         self.bank = Bank("patches: {}")
+        self._patch = None
         self._sfonts = {}
-        self._router = Router(fluid_default=False, fluid_router=False)
+        self._router = Router(
+            fluid_default=False,
+            fluid_router=False,
+            coalesce=CONFIG.get("coalesce", 0),
+        )
         if fluidlog == -1:
             fluidlog = lambda lev, msg: None
-        self._synth = Synth(
-            fluidsettings=CONFIG["fluidsettings"] | fluidsettings,
-            logfunc=fluidlog,
-            midi_handler=self._router.handle_midi,
-        )
+        if shards > 1:
+            if not offline:
+                raise ValueError("shards need offline=True")
+            # imported here so multiprocessing is only loaded when needed
+            from .shards import ShardedSynth
+            self._synth = ShardedSynth(
+                fluidsettings=CONFIG["fluidsettings"] | fluidsettings,
+                logfunc=fluidlog,
+                shards=shards,
+            )
+        else:
+            self._synth = Synth(
+                fluidsettings=CONFIG["fluidsettings"] | fluidsettings,
+                logfunc=fluidlog,
+                offline=offline,
+                midi=False,
+            )
         self._router.synth = self._synth
+        self._startup_times = {"config": configured - t} | self._synth.startup_times
+        # the MIDI driver belongs to the patcher, so it keeps running when
+        # switch_bank() replaces the synth
+        self._mididriver = None
+        if not offline and midi:
+            started = time.perf_counter()
+            self._mididriver = pfluidsynth.MidiDriver(
+                CONFIG["fluidsettings"] | fluidsettings,
+                # look up the router for each event, so switch_bank() can replace it
+                lambda event: self._router.handle_midi(event),
+            )
+            self._startup_times["midi driver"] = time.perf_counter() - started
+        self._startup_times["total"] = time.perf_counter() - t
 
     @property
     def soundfonts(self):
         """dict[path, SoundFont]: A snapshot of the loaded soundfonts."""
         return self._sfonts
 
+    @property
+    def startup_times(self):
+        """
+        dict: Seconds spent in each phase of starting up - setting up
+        the configuration, finding and opening the FluidSynth library
+        and declaring its functions, and creating the synth and its
+        drivers. Library phases are from when it was first loaded.
+        """
+        return self._startup_times
+
+    @property
+    def switch_times(self):
+        """
+        dict: Seconds the last ``switch_bank()`` took - ``prepare`` is
+        how long the standby engine took to load in the background,
+        ``wait`` how long the switch had to wait for it to finish, and
+        ``switch`` how long MIDI input was held up by the switch itself.
+        """
+        return self._switch_times
+
+    @property
+    def coalesce_stats(self):
+        """
+        dict: Counts of throttled setting/fx writes from MIDI rules.
+        ``writes`` were applied to the synth, ``merged`` were replaced
+        by a newer value before they could be applied.
+        """
+        if c := self._router.coalescer:
+            return {"writes": c.writes, "merged": c.merged}
+        return {"writes": 0, "merged": 0}
+
     def open_soundfont(self, path):
         """
-        Load a soundfont and enumerate its presets.
+        Load a soundfont and enumerate its presets. Each FluidPatcher
+        loads its own copy, which is freed once it is unloaded and its
+        notes have stopped.
 
         Args:
           path (str|Path):
@@ -104,7 +321,7 @@ class FluidPatcher:
             self._sfonts[sf].file = sf
         return self._sfonts[sf]
 
-    def load_bank(self, bankfile="", raw=""):
+    def load_bank(self, bankfile="", raw="", lazy=False, hot=False):
         """
         Load a bank from a YAML file or raw text.
 
@@ -112,44 +329,79 @@ class FluidPatcher:
           bankfile (str|Path):
             Filename relative to CONFIG["banks_path"], or absolute.
 
-          raw (str):
-            YAML text to load directly, bypassing disk I/O.
-        """
-        def read_bank(files, raw="", indent=0):
-            text = ""
-            if files:
-                try:
-                    raw = (CONFIG["banks_path"] / files[-1]).read_text()
-                except FileNotFoundError as e:
-                    raise BankValidationError(
-                        f"No such file {files[-1]}"
-                    )
-            for line in raw.splitlines(keepends=True):
-                if "#include" in line:
-                    i = line.index("#include")
-                    f = line[i + 9:].rstrip()
-                    if f not in files:
-                        if line[:i].isspace():
-                            line = read_bank(files + [f], indent=i)
-                        else:
-                            line = line[:i] + read_bank(files + [f])
-                text += " " * indent + line
-            return text
-        self.bank = Bank(read_bank(
-            [bankfile] if bankfile else [], raw
-        ))
-        self._synth.reset()
-        for zone in self.bank:
+          raw (str|Bank):
+            YAML text to load directly, bypassing disk I/O, or an
+            already parsed Bank, e.g. from ``Bank.reparse()``.
+
+          lazy (bool):
+            Parse and validate each patch only when it is first used.
+
+          hot (bool):
+            Swap in the new bank without resetting the synth. Players,
+            effects and soundfonts that are still in use keep running,
+            and the current patch is re-applied only if its definition
+            changed. Falls back to a full reload if the current patch
+            was removed from the bank.
+        """
+        sources = []
+        def resolve_paths(zone):
             for midi in zone.get("midifiles", {}).values():
                 midi.file = CONFIG["midi_path"] / midi.file
             for fx in zone.get("ladspafx", {}).values():
                 fx.lib = CONFIG["ladspa_path"] / fx.lib
+        if isinstance(raw, Bank):
+            bank = raw
+        else:
+            bank = bankcache.load(bankfile, lazy) if bankfile else None
+        if bank is None:
+            srcmap = []
+            text = expand_includes(bankfile, raw, sources, srcmap)
+            try:
+                bank = Bank(text, lazy)
+            except BankSyntaxError as e:
+                e.map_source(srcmap)
+                raise
+            if bankfile:
+                bankcache.store(bankfile, sources, bank, lazy)
+        old, self.bank = self.bank, bank
+        self.bank.map_zones(resolve_paths)
+        if hot and self._patch in old and self._patch in self.bank:
+            self._reload(old, self._patch)
+            return
+        self._patch = None
+        self._synth.reset()
         init = self.bank.root.get("init", {})
         for name, val in (SYNTH_DEFAULTS | init.get("fluidsettings", {})).items():
             self._synth[name] = val
         for msg in init.get("messages", []):
             self.send_midimessage(msg)
 
+    def _reload(self, old, patch):
+        # brings the synth in line with a new version of the bank while
+        # touching as little as possible of what is currently running
+        oldroot = {k: v for k, v in old.root.items() if k != "patches"}
+        newroot = {k: v for k, v in self.bank.root.items() if k != "patches"}
+        init = newroot.get("init", {})
+        if _changed(oldroot.get("init", {}), init):
+            # settings dropped from init go back to their defaults, as
+            # they would on a full load
+            for name, val in (SYNTH_DEFAULTS | init.get("fluidsettings", {})).items():
+                self._synth[name] = val
+            for msg in init.get("messages", []):
+                self.send_midimessage(msg)
+        if not (
+            _changed(oldroot, newroot)
+            or _changed(old.patch[patch], self.bank.patch[patch])
+        ):
+            return
+        # players are only added if their name isn't already running
+        for ptype in PLAYER_TYPES:
+            for name in list(self._synth.players[ptype]):
+                if _changed(old[patch][ptype].get(name),
+                            self.bank[patch][ptype].get(name)):
+                    self._synth.player_remove(ptype, name)
+        self.apply_patch(patch)
+
     def save_bank(self, bankfile, raw=""):
         """
         Write the current bank contents to disk.
@@ -167,6 +419,109 @@ class FluidPatcher:
             raw = self.bank.dump()
         (CONFIG["banks_path"] / bankfile).write_text(raw)
 
+    def prepare_bank(self, bankfile="", raw="", patch=None):
+        """
+        Load a bank into a standby engine in the background, ready for
+        ``switch_bank()``. The standby engine is a second, silent synth:
+        its soundfonts are loaded, the bank's init is applied and a
+        patch is staged while this one keeps playing. The standby
+        engine loads its own copies of the soundfonts, since two
+        engines can't safely play one loaded font during the crossfade.
+
+        Args:
+          bankfile (str|Path):
+            Filename relative to CONFIG["banks_path"], or absolute.
+
+          raw (str|Bank):
+            YAML text or a parsed Bank to load instead.
+
+          patch (str):
+            Patch to stage, by default the first in the bank.
+        """
+        standby = {"started": time.perf_counter()}
+
+        def build():
+            fp = None
+            try:
+                fp = FluidPatcher(**self._options, midi=False)
+                fp.load_bank(bankfile, raw)
+                if patch or fp.bank.patches:
+                    fp.apply_patch(patch or fp.bank.patches[0])
+                # keep quiet until switched to
+                standby["gain"] = fp._synth["synth.gain"]
+                fp._synth["synth.gain"] = 0
+                standby["patcher"] = fp
+            except Exception as e:
+                standby["error"] = e
+                if fp:
+                    _retire(fp._synth, fp._router, 0)
+            standby["ready"] = time.perf_counter()
+
+        standby["thread"] = threading.Thread(target=build, daemon=True)
+        standby["thread"].start()
+        self._standby = standby
+
+    def switch_bank(self, fade=0.5):
+        """
+        Switch to the bank loaded by ``prepare_bank()``, waiting for it
+        to finish loading if needed. MIDI input and the current patch
+        move to the standby engine at once, while notes still sounding
+        on the old engine fade out before it is deleted. How long this
+        took is in ``switch_times``.
+
+        Live audio from two engines at once needs an audio system that
+        mixes clients, e.g. JACK, PipeWire, PulseAudio or ALSA dmix.
+
+        Args:
+          fade (float):
+            Seconds to fade out the old engine.
+
+        Raises:
+          RuntimeError: if no bank was prepared
+          BankSyntaxError, BankValidationError, OSError: from loading
+            the prepared bank, which leaves this engine playing
+        """
+        if self._standby is None:
+            raise RuntimeError("No bank prepared - call prepare_bank() first")
+        standby, self._standby = self._standby, None
+        t = time.perf_counter()
+        standby["thread"].join()
+        waited = time.perf_counter() - t
+        if "error" in standby:
+            raise standby["error"]
+        fp = standby["patcher"]
+        t = time.perf_counter()
+        fp._synth["synth.gain"] = standby["gain"]
+        fp._router.callback = self._router.callback
+        old = self._synth, self._router
+        self.bank, self._patch, self._sfonts = fp.bank, fp._patch, fp._sfonts
+        self._synth = fp._synth
+        self._router = fp._router # MIDI input switches here
+        self._switch_times = {
+            "prepare": standby["ready"] - standby["started"],
+            "wait": waited,
+            "switch": time.perf_counter() - t,
+        }
+        threading.Thread(
+            target=_retire, args=(*old, 0 if old[0].offline else fade), daemon=True
+        ).start()
+
+    def close(self):
+        """
+        Stop FluidSynth and free the synth, its drivers and any bank
+        prepared for ``switch_bank()``. The FluidPatcher can't be used
+        afterwards.
+        """
+        if self._standby:
+            self._standby["thread"].join()
+            if fp := self._standby.get("patcher"):
+                fp.close()
+            self._standby = None
+        if self._mididriver:
+            self._mididriver.delete()
+            self._mididriver = None
+        _retire(self._synth, self._router, 0)
+
     def apply_patch(self, patch):
         """
         Apply a named patch from the loaded bank.
@@ -174,12 +529,16 @@ class FluidPatcher:
         Args:
           patch (str): The patch name to apply.
         """
+        self._patch = patch
+        # the patch may have been edited in place since it was indexed
+        self.bank.reindex(patch)
         # load all needed soundfonts at once to speed up patches
         # free memory of unneeded soundfonts
-        for sf in set(self._sfonts) - self.bank.soundfonts:
+        sfonts = self.bank.soundfonts
+        for sf in set(self._sfonts) - sfonts:
             self._synth.unload_soundfont(self._sfonts[sf])
             del self._sfonts[sf]
-        for sf in self.bank.soundfonts - set(self._sfonts):
+        for sf in sfonts - set(self._sfonts):
             self.open_soundfont(sf)
         # select presets
         for chan in range(1, self._synth["synth.midi-channels"] + 1):
@@ -199,12 +558,7 @@ class FluidPatcher:
                 if name not in self._synth.players[ptype]:
                     self._synth.player_add(ptype, name, player)
         # ladspa effects
-        wanted = self.bank[patch]["ladspafx"] | PATCHCORD
-        if set(wanted) != set(self._synth.ladspafx):
-            self._synth.fxchain_clear()
-            for name, fx in wanted.items():
-                self._synth.fxchain_add(name, fx)
-            self._synth.fxchain_connect()
+        self._synth.fxchain_update(self.bank[patch]["ladspafx"] | config.PATCHCORD)
         # counters
         for name in list(self._router.counters):
             if name not in self.bank[patch]["counters"]:
@@ -245,6 +599,7 @@ class FluidPatcher:
                     del self.bank.patch[name][chan]
             else:
                 self.bank.patch[name][chan] = SFPreset(sfonts[id], bank, prog)
+        self.bank.reindex(name)
 
     def add_midirule(self, rule):
         """
@@ -277,6 +632,128 @@ class FluidPatcher:
         else:
             self._router.callback = lambda event: None
 
+    def render(self, duration=None, events=(), midifile=None, wavfile=None, tail=1.0,
+               stems=False, blocksize=render.BLOCKSIZE, blocktimes=None):
+        """
+        Render audio faster than real time, for a FluidPatcher created
+        with ``offline=True``. The sequencer and players advance with the
+        rendered audio, so sequences, arpeggios and MIDI files play just
+        as they would live.
+
+        Args:
+          duration (float):
+            Seconds to render, or None to render until the last event
+            and the MIDI file are done, plus ``tail``.
+
+          events (list[tuple[float, MidiMessage]]):
+            Messages to play at times in seconds from the start. They
+            pass through the router like incoming MIDI, so the current
+            patch's rules apply.
+
+          midifile (str|Path):
+            MIDI file to play from the start, relative to
+            ``CONFIG["midi_path"]`` or absolute. It is played directly
+            to the synth, like a ``midifiles`` player.
+
+          wavfile (str|Path):
+            Write the audio to this file as 32-bit float WAV instead
+            of returning it.
+
+          tail (float):
+            Seconds to keep rendering when ``duration`` is None, so
+            that released notes can decay.
+
+          stems (bool):
+            Render each audio group as its own stereo stem, followed by
+            a stem with the reverb and chorus. MIDI channels play into
+            audio group ``(channel - 1) % synth.audio-groups``, so with
+            the default 16 groups every channel gets a stem. A
+            ``wavfile`` named e.g. ``take.wav`` becomes ``take-01.wav``,
+            ``take-02.wav``... and ``take-fx.wav``.
+
+          blocksize (int):
+            Largest number of frames to render at once. Blocks are
+            split where events fall.
+
+          blocktimes (list):
+            If given, a ``(frames, seconds)`` tuple is appended for
+            each block rendered, e.g. to find the worst-case time to
+            render an audio period of ``blocksize`` frames.
+
+        Returns:
+          array.array | list | None: Interleaved stereo float samples, a
+          list of them for each stem, or None if ``wavfile`` was given.
+          Wrap with e.g.
+          ``numpy.frombuffer(audio, numpy.float32).reshape(-1, 2)`` for
+          a NumPy view.
+        """
+        if not self._synth.offline:
+            raise RuntimeError("render() needs a FluidPatcher created with offline=True")
+        timed = [
+            (t, lambda msg=msg: self._router.handle_midi(_RoutedMessage(msg)))
+            for t, msg in events
+        ]
+        player = None
+        if midifile:
+            player = pfluidsynth.MidiFile(
+                self._synth, MidiFile(file=CONFIG["midi_path"] / midifile)
+            )
+            player.play()
+        done = (lambda: player.done) if player else None
+        out = None
+        rate = self._synth["synth.sample-rate"]
+        if wavfile and stems:
+            wavfile = Path(wavfile)
+            names = [f"{n:02}" for n in range(1, self._synth["synth.audio-groups"] + 1)]
+            out = render.StemWriter(
+                [wavfile.with_stem(f"{wavfile.stem}-{name}") for name in names + ["fx"]],
+                rate,
+            )
+        elif wavfile:
+            out = render.WavWriter(wavfile, rate)
+        try:
+            audio = render.render(
+                self._synth, duration, timed, done, out, tail,
+                blocksize=blocksize, stems=stems, blocktimes=blocktimes,
+            )
+        finally:
+            if player:
+                player.dismiss()
+            if out:
+                out.close()
+        return audio if out is None else None
+
+    def pull(self, buffers, nframes=None, fxbuffers=None):
+        """
+        Render the next block of audio into preallocated buffers, for a
+        FluidPatcher created with ``offline=True`` that feeds audio to
+        another program, e.g. a custom mixer or a network stream.
+
+        Args:
+          buffers (list):
+            Writable float32 buffers (NumPy arrays, ``array("f")`` or
+            memoryviews), one per channel: left and right of the first
+            output, then of the next, for up to
+            ``synth.audio-channels`` outputs. Audio groups are mixed
+            into output ``group % outputs``, so passing a pair for
+            every audio group gives one stem per group. The buffers are
+            filled in place, and reusing them on every call avoids
+            allocations.
+
+          nframes (int):
+            Frames to render, by default the length of the buffers.
+
+          fxbuffers (list):
+            Left and right buffers for the reverb and chorus, which are
+            otherwise mixed into the first output.
+
+        Returns:
+          int: The number of frames rendered.
+        """
+        if not self._synth.offline:
+            raise RuntimeError("pull() needs a FluidPatcher created with offline=True")
+        return self._synth.process(buffers, nframes, fxbuffers)
+
     @contextmanager
     def midi_capture(self, func):
         """
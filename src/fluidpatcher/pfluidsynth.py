@@ -3,6 +3,10 @@ ctypes bindings and interface classes for fluidsynth
 """
 from ctypes.util import find_library
 from ctypes import *
+import mmap
+import os
+import threading
+import time
 
 FLUID_OK = 0
 FLUID_FAILED = -1
@@ -25,20 +29,149 @@ MIDI_TYPES = {
 PLAYER_TYPES = "sequences", "arpeggios", "midiloops", "midifiles"
 SEQ_LAG = 10
 
-fslib = find_library("fluidsynth") or find_library("libfluidsynth-3")
-if fslib is None:
-    raise ImportError("Couldn't find the FluidSynth library.")
-FS = CDLL(fslib)
-ladspa_available = hasattr(FS, "fluid_ladspa_reset")
-
-# type hints for ctypes as needed
-FS.new_fluid_midi_event.restype = c_void_p
-FS.new_fluid_event.restype = c_void_p
-FS.fluid_preset_get_name.restype = c_char_p
-FS.fluid_sfont_iteration_next.restype = c_void_p
-FS.fluid_synth_handle_midi_event.argtypes = c_void_p, c_void_p
-FS.fluid_midi_router_handle_midi_event.argtypes = c_void_p, c_void_p
 fl_eventcallback = CFUNCTYPE(c_int, c_void_p, c_void_p)
+# soundfont loader file callbacks
+fl_sfopen = CFUNCTYPE(c_void_p, c_char_p)
+fl_sfread = CFUNCTYPE(c_int, c_void_p, c_longlong, c_void_p)
+fl_sfseek = CFUNCTYPE(c_int, c_void_p, c_longlong, c_int)
+fl_sftell = CFUNCTYPE(c_longlong, c_void_p)
+fl_sfclose = CFUNCTYPE(c_int, c_void_p)
+
+# real-time parameters that have direct synth setters/getters - those
+# named *_group_* take an fx group, gain is declared in PROTOTYPES
+SYNTH_PARAMS = {
+    "synth.gain": ("gain", c_float),
+    "synth.reverb.room-size": ("reverb_group_roomsize", c_double),
+    "synth.reverb.damp": ("reverb_group_damp", c_double),
+    "synth.reverb.width": ("reverb_group_width", c_double),
+    "synth.reverb.level": ("reverb_group_level", c_double),
+    "synth.chorus.nr": ("chorus_group_nr", c_int),
+    "synth.chorus.level": ("chorus_group_level", c_double),
+    "synth.chorus.speed": ("chorus_group_speed", c_double),
+    "synth.chorus.depth": ("chorus_group_depth", c_double),
+}
+
+
+# function types, declared once when the library is loaded
+PROTOTYPES = {
+    "new_fluid_midi_event": {"restype": c_void_p},
+    "new_fluid_event": {"restype": c_void_p},
+    "fluid_preset_get_name": {"argtypes": (c_void_p,), "restype": c_char_p},
+    "fluid_preset_get_banknum": {"argtypes": (c_void_p,)},
+    "fluid_preset_get_num": {"argtypes": (c_void_p,)},
+    "fluid_preset_get_sfont": {"argtypes": (c_void_p,), "restype": c_void_p},
+    "fluid_sfont_get_name": {"argtypes": (c_void_p,), "restype": c_char_p},
+    "fluid_sfont_iteration_start": {"argtypes": (c_void_p,)},
+    "fluid_sfont_iteration_next": {"argtypes": (c_void_p,), "restype": c_void_p},
+    "delete_fluid_sfont": {"argtypes": (c_void_p,)},
+    "fluid_synth_get_sfont_by_id": {"argtypes": (c_void_p, c_int), "restype": c_void_p},
+    "fluid_synth_add_sfont": {"argtypes": (c_void_p, c_void_p)},
+    "fluid_synth_remove_sfont": {"argtypes": (c_void_p, c_void_p)},
+    "fluid_synth_get_channel_preset": {"argtypes": (c_void_p, c_int), "restype": c_void_p},
+    "fluid_synth_program_select_by_sfont_name": {
+        "argtypes": (c_void_p, c_int, c_char_p, c_int, c_int)
+    },
+    "new_fluid_defsfloader": {"argtypes": (c_void_p,), "restype": c_void_p},
+    "new_fluid_audio_driver": {"restype": c_void_p},
+    "delete_fluid_audio_driver": {"argtypes": (c_void_p,)},
+    "new_fluid_midi_driver": {"restype": c_void_p},
+    "delete_fluid_midi_driver": {"argtypes": (c_void_p,)},
+    "fluid_synth_add_sfloader": {"argtypes": (c_void_p, c_void_p)},
+    "fluid_sfloader_set_callbacks": {
+        "argtypes": (c_void_p, fl_sfopen, fl_sfread, fl_sfseek, fl_sftell, fl_sfclose)
+    },
+    "fluid_synth_handle_midi_event": {"argtypes": (c_void_p, c_void_p)},
+    "fluid_midi_router_handle_midi_event": {"argtypes": (c_void_p, c_void_p)},
+    "fluid_ladspa_effect_set_control": {"argtypes": (c_void_p, c_char_p, c_char_p, c_float)},
+    "fluid_synth_set_gain": {"argtypes": (c_void_p, c_float)},
+    "fluid_synth_get_gain": {"argtypes": (c_void_p,), "restype": c_float},
+    "fluid_synth_process": {
+        "argtypes": (c_void_p, c_int, c_int, c_void_p, c_int, c_void_p)
+    },
+}
+for param, ctype in SYNTH_PARAMS.values():
+    if "_group_" not in param:
+        continue
+    PROTOTYPES[f"fluid_synth_set_{param}"] = {"argtypes": (c_void_p, c_int, ctype)}
+    PROTOTYPES[f"fluid_synth_get_{param}"] = {"argtypes": (c_void_p, c_int, POINTER(ctype))}
+
+# how the library was found and how long each step took
+library_path = None
+library_searched = False
+load_times = {}
+
+
+def _lap(times, phase, start):
+    now = time.perf_counter()
+    times[phase] = now - start
+    return now
+
+
+def load_library(path=None):
+    """
+    Finds and loads the FluidSynth library and declares the function
+    types it needs. This happens when the first Synth is created (or
+    ``FS`` is first used), so importing this module stays cheap.
+
+    Args:
+      path (str|Path): Library file or name to try before searching the
+        system for it. The ``LIBFLUIDSYNTH_PATH`` environment variable
+        takes precedence over this. ``find_library()`` is only used if
+        neither is given or the file can't be loaded, since it may run
+        ``ldconfig`` or a compiler.
+
+    Returns:
+      (CDLL): the loaded library
+    """
+    global FS, ladspa_available, direct_params, library_path, library_searched
+    if not isinstance(FS, _LazyLibrary):
+        return FS
+    t = time.perf_counter()
+    lib = None
+    for name in os.getenv("LIBFLUIDSYNTH_PATH"), path:
+        if name:
+            try:
+                lib = CDLL(str(name))
+                library_path = str(name)
+                break
+            except OSError:
+                pass
+    if lib is None:
+        library_path = find_library("fluidsynth") or find_library("libfluidsynth-3")
+        if library_path is None:
+            raise ImportError("Couldn't find the FluidSynth library.")
+        t = _lap(load_times, "find", t)
+        lib = CDLL(library_path)
+        library_searched = True
+    t = _lap(load_times, "open", t)
+    for name, proto in PROTOTYPES.items():
+        if hasattr(lib, name):
+            func = getattr(lib, name)
+            for attr, val in proto.items():
+                setattr(func, attr, val)
+    ladspa_available = hasattr(lib, "fluid_ladspa_reset")
+    direct_params = hasattr(lib, "fluid_synth_set_reverb_group_roomsize")
+    _lap(load_times, "prototypes", t)
+    FS = lib
+    return FS
+
+
+class _LazyLibrary:
+    """Stands in for the FluidSynth library until it's first used"""
+
+    def __getattr__(self, name):
+        return getattr(load_library(), name)
+
+
+FS = _LazyLibrary()
+
+
+def __getattr__(name):
+    # library features are only known once it's loaded
+    if name in ("ladspa_available", "direct_params"):
+        load_library()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FluidMidiEvent:
@@ -351,8 +484,7 @@ class MidiFile:
             frouter = FS.new_fluid_midi_router(synth.st, self.frouter_handler, synth.frouter)
         else:
             # send midifile events directly to the synth (default)
-            self.frouter_handler = fl_eventcallback(FS.fluid_synth_handle_midi_event)
-            frouter = FS.new_fluid_midi_router(synth.st, self.frouter_handler, synth.fsynth)
+            frouter = FS.new_fluid_midi_router(synth.st, synth.frouter_handler, synth.fsynth)
         FS.fluid_midi_router_clear_rules(frouter)
         for rtype in set(RULE_TYPES) - set(getattr(mfile, "mask", [])):
             rule = FS.new_fluid_midi_router_rule()
@@ -397,6 +529,10 @@ class MidiFile:
             else:
                 self.lasttick = tick
 
+    @property
+    def done(self):
+        return FS.fluid_player_get_status(self.fplayer) == FLUID_PLAYER_DONE
+
     def set_tempo(self, bpm=0):
         if bpm:
             usec = int(60000000.0 / bpm) # usec per quarter note (MIDI standard)
@@ -423,6 +559,9 @@ class LadspaEffect:
         stereo = True if len(aports) == 4 else False
         self.fxunits = []
         self.links = {}
+        self.controls = {}
+        self.vals = dict(portvals) # live values, including ports set by rules
+        self.declared = set(portvals)
         def addfxunit():
             fxunit = f"{name}{len(self.fxunits)}".encode()
             if FS.fluid_ladspa_add_effect(self.ladspa, fxunit, lib, plugin) != FLUID_OK:
@@ -448,25 +587,267 @@ class LadspaEffect:
             FS.fluid_ladspa_effect_link(self.ladspa, fxunit, fxin, inp.encode())
             FS.fluid_ladspa_effect_link(self.ladspa, fxunit, fxout, outp.encode())
 
+    def control(self, port):
+        """Returns a reusable handle for setting a control port"""
+        if port not in self.controls:
+            self.controls[port] = LadspaControl(self, port)
+        return self.controls[port]
+
     def setcontrol(self, port, val):
+        self.control(port).set(val)
+
+    def update(self, vals):
+        """
+        Sets control ports whose live values differ from ``vals``.
+        Returns False if a port declared before is missing from
+        ``vals``, which needs a rebuild to get its plugin default back.
+        Ports only set by rules keep their live values.
+        """
+        if self.declared - vals.keys():
+            return False
+        for port, val in vals.items():
+            if self.vals.get(port) != val:
+                self.control(port).set(val)
+        self.declared = set(vals)
+        return True
+
+
+class LadspaControl:
+    """
+    A control port resolved once for every unit of an effect, so that
+    mono effects duplicated across audio groups are set in one call
+    """
+
+    def __init__(self, effect, port):
+        self.ladspa = effect.ladspa
+        self.fxunits = effect.fxunits
+        self.vals = effect.vals
+        self.name = port
+        self.port = port.encode()
+
+    def set(self, val):
         for fxunit in self.fxunits:
-            FS.fluid_ladspa_effect_set_control(self.ladspa, fxunit, port.encode(), c_float(val))
+            FS.fluid_ladspa_effect_set_control(self.ladspa, fxunit, self.port, val)
+        # track the live value, so patch changes can tell what to reset
+        self.vals[self.name] = val
+
+
+class FluidSetting:
+    """A fluidsynth setting with its encoded name and type looked up once"""
+
+    def __init__(self, st, name):
+        self.st = st
+        self.key = name.encode()
+        self.type = FS.fluid_settings_get_type(st, self.key)
+
+    def get(self):
+        if self.type == FLUID_STR_TYPE:
+            strval = create_string_buffer(32)
+            if FS.fluid_settings_copystr(self.st, self.key, strval, 32) == FLUID_OK:
+                return strval.value.decode()
+        elif self.type == FLUID_INT_TYPE:
+            val = c_int()
+            if FS.fluid_settings_getint(self.st, self.key, byref(val)) == FLUID_OK:
+                return val.value
+        elif self.type == FLUID_NUM_TYPE:
+            num = c_double()
+            if FS.fluid_settings_getnum(self.st, self.key, byref(num)) == FLUID_OK:
+                return round(num.value, 6)
+        return None
+
+    def set(self, val):
+        if self.type == FLUID_STR_TYPE:
+            FS.fluid_settings_setstr(self.st, self.key, str(val).encode())
+        elif self.type == FLUID_INT_TYPE:
+            FS.fluid_settings_setint(self.st, self.key, int(val))
+        elif self.type == FLUID_NUM_TYPE:
+            FS.fluid_settings_setnum(self.st, self.key, c_double(float(val)))
+
+
+class SynthParam(FluidSetting):
+    """A real-time setting written straight to the running synth"""
+
+    def __init__(self, st, name, fsynth):
+        super().__init__(st, name)
+        self.fsynth = fsynth
+        param, self.ctype = SYNTH_PARAMS[name]
+        self.convert = int if self.ctype == c_int else float
+        self.setter = getattr(FS, f"fluid_synth_set_{param}")
+        self.getter = getattr(FS, f"fluid_synth_get_{param}")
+        self.grouped = "_group_" in param
+
+    def get(self):
+        if not self.grouped:
+            return round(self.getter(self.fsynth), 6)
+        val = self.ctype()
+        if self.getter(self.fsynth, -1, byref(val)) == FLUID_OK:
+            return round(val.value, 6)
+        return None
+
+    def set(self, val):
+        if self.grouped:
+            # fx group -1 applies the value to all groups
+            self.setter(self.fsynth, -1, self.convert(val))
+        else:
+            self.setter(self.fsynth, float(val))
+
+
+def fxchain_topology(effects):
+    """Describes the parts of an effects chain that require a rebuild"""
+    return tuple(
+        (name, str(fx.lib), getattr(fx, "plugin", ""),
+         tuple(getattr(fx, "chan", [])),
+         tuple(getattr(fx, "audio", ("Input", "Output"))))
+        for name, fx in effects.items()
+    )
+
+
+class MmapFiles:
+    """
+    File callbacks for a soundfont loader that read from memory maps.
+
+    FluidSynth's default loader reads fonts with ``fread`` through a
+    private stdio buffer. These callbacks copy straight out of a
+    copy-on-write (``ACCESS_COPY``) mapping of the file instead, which
+    ctypes needs to take its address but which is never written to, so
+    its pages stay shared. Loading is then a single copy from the OS
+    page cache, which is shared by every process on the machine and
+    stays warm across restarts. FluidSynth still keeps its own copy of
+    the sample data.
+    """
+
+    def __init__(self):
+        self.files = {} # handle: [mmap, view, address, position]
+        self.handles = iter(range(1, 1 << 30))
+        self.callbacks = (
+            fl_sfopen(self.open),
+            fl_sfread(self.read),
+            fl_sfseek(self.seek),
+            fl_sftell(self.tell),
+            fl_sfclose(self.close),
+        )
+
+    def install(self, settings):
+        """Returns a new soundfont loader that uses these callbacks"""
+        loader = FS.new_fluid_defsfloader(settings)
+        FS.fluid_sfloader_set_callbacks(loader, *self.callbacks)
+        return loader
+
+    def open(self, filename):
+        try:
+            with open(filename, "rb") as f:
+                # a private mapping is writable for ctypes, but reads still
+                # come from the shared page cache
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return None # lets the next loader try
+        view = (c_char * len(m)).from_buffer(m)
+        handle = next(self.handles)
+        self.files[handle] = [m, view, addressof(view), 0]
+        return handle
+
+    def read(self, buf, count, handle):
+        f = self.files[handle]
+        if f[3] + count > len(f[0]):
+            return FLUID_FAILED
+        memmove(buf, f[2] + f[3], count)
+        f[3] += count
+        return FLUID_OK
+
+    def seek(self, handle, offset, origin):
+        f = self.files[handle]
+        pos = (0, f[3], len(f[0]))[origin] + offset
+        if not 0 <= pos <= len(f[0]):
+            return FLUID_FAILED
+        f[3] = pos
+        return FLUID_OK
+
+    def close(self, handle):
+        m, view, *_ = self.files.pop(handle)
+        del view
+        m.close()
+        return FLUID_OK
+
+    def tell(self, handle):
+        return self.files[handle][3]
+
+
+class SoundFontRegistry:
+    """
+    Loads soundfonts for synths, in one synth without drivers that
+    owns them, and frees them once their samples stop sounding.
+
+    Each synth that loads a file gets its own copy, which is added to
+    its font stack with ``fluid_synth_add_sfont``. A loaded font is never
+    shared between synths: FluidSynth counts the voices using each
+    sample under the playing synth's own lock, so two synths playing one
+    font at once, such as the two engines of a ``switch_bank()``
+    crossfade, could race on the counts and leak the font or free it
+    while it is still sounding. If ``mmap`` is set to true before the
+    first font is loaded, files are read through memory maps (see
+    ``MmapFiles``), so later copies load from the OS page cache.
+    """
+
+    def __init__(self):
+        self.fonts = {} # fsfont: path
+        self.owner = None
+        self.retired = []
+        self.lock = threading.Lock()
+        self.mmap = False
+        self.files = None
+
+    def acquire(self, path):
+        """Loads a copy of the font at ``path`` and returns it and its presets"""
+        path = os.path.realpath(path)
+        with self.lock:
+            if self.owner is None:
+                st = FS.new_fluid_settings()
+                self.owner = FS.new_fluid_synth(st)
+                if self.mmap:
+                    # added loaders are tried before the default one
+                    self.files = MmapFiles()
+                    FS.fluid_synth_add_sfloader(self.owner, self.files.install(st))
+            sfid = FS.fluid_synth_sfload(self.owner, path.encode(), False)
+            if sfid == FLUID_FAILED:
+                raise OSError(f"Unable to load {path}")
+            fsfont = FS.fluid_synth_get_sfont_by_id(self.owner, sfid)
+            self.fonts[fsfont] = path
+            return fsfont, _presets(fsfont)
+
+    def release(self, fsfont):
+        """Frees a font once no voice is playing its samples any more"""
+        with self.lock:
+            if self.fonts.pop(fsfont, None) is not None:
+                FS.fluid_synth_remove_sfont(self.owner, fsfont)
+                self.retired.append(fsfont)
+            # fonts whose samples are still sounding can't be freed yet
+            self.retired = [f for f in self.retired if FS.delete_fluid_sfont(f) != FLUID_OK]
+
+
+sfont_registry = SoundFontRegistry()
+
+
+def _presets(fsfont):
+    presets = {}
+    FS.fluid_sfont_iteration_start(fsfont)
+    while True:
+        p = FS.fluid_sfont_iteration_next(fsfont)
+        if p == None: break
+        bank = FS.fluid_preset_get_banknum(p)
+        prog = FS.fluid_preset_get_num(p)
+        name = FS.fluid_preset_get_name(p).decode()
+        presets[bank, prog] = name
+    return presets
 
 
 class SoundFont:
     """An iterable soundfont container"""
 
-    def __init__(self, fsfont, sfid):
+    def __init__(self, fsfont, sfid, presets):
         self.id = sfid
-        self._presets = {}
-        FS.fluid_sfont_iteration_start(fsfont)
-        while True:
-            p = FS.fluid_sfont_iteration_next(fsfont)
-            if p == None: break
-            bank = FS.fluid_preset_get_banknum(p)
-            prog = FS.fluid_preset_get_num(p)
-            name = FS.fluid_preset_get_name(p).decode()
-            self._presets[bank, prog] = name
+        self.fsfont = fsfont
+        self.name = FS.fluid_sfont_get_name(fsfont)
+        self._presets = presets
 
     def __getitem__(self, p):
         return self._presets[p] if p in self._presets else ""
@@ -484,21 +865,68 @@ class SoundFont:
         return len(self._presets)
 
 
+class MidiDriver:
+    """
+    A MIDI driver that passes events from MIDI inputs to a handler. It
+    has its own settings, so it can outlive the synths it plays.
+
+    Args:
+      fluidsettings (dict): FluidSynth settings, of which the driver
+        uses the ``midi.*`` ones
+      handler (callable): Called with a FluidMidiEvent for each event
+    """
+
+    def __init__(self, fluidsettings, handler):
+        load_library()
+        self.st = FS.new_fluid_settings()
+        for name, val in fluidsettings.items():
+            FluidSetting(self.st, name).set(val)
+        self.handler = fl_eventcallback(lambda _, e: handler(FluidMidiEvent(e)) or FLUID_OK)
+        self.fdriver = FS.new_fluid_midi_driver(self.st, self.handler, None)
+
+    def delete(self):
+        """Stops the driver and frees it"""
+        if self.fdriver:
+            FS.delete_fluid_midi_driver(self.fdriver)
+            FS.delete_fluid_settings(self.st)
+            self.fdriver = None
+
+
 class Synth:
 
-    def __init__(self, fluidsettings={}, logfunc=None, midi_handler=None):
+    def __init__(self, fluidsettings={}, logfunc=None, midi_handler=None, offline=False,
+                 midi=True):
+        load_library()
+        self.offline = offline
+        if offline:
+            # players follow rendered audio instead of the system clock
+            fluidsettings = fluidsettings | {"player.timing-source": "sample"}
+        # seconds spent in each startup phase, including loading the library
+        self.startup_times = dict(load_times)
+        t = time.perf_counter()
         self.st = FS.new_fluid_settings()
+        self.fsynth = None
+        self._settings = {}
         for name, val in fluidsettings.items():
             self[name] = val
+        if offline and "synth.audio-channels" not in fluidsettings:
+            # no driver to feed, so give each audio group its own output
+            self["synth.audio-channels"] = self["synth.audio-groups"]
         if logfunc:
             self.logfunc = CFUNCTYPE(None, c_int, c_char_p, c_void_p)(
                 lambda lev, msg, _: logfunc(lev, msg)
             )
             for lev in range(5):
                 FS.fluid_set_log_function(lev, self.logfunc)
+        t = _lap(self.startup_times, "settings", t)
         self.fsynth = FS.new_fluid_synth(self.st)
-        FS.new_fluid_audio_driver(self.st, self.fsynth)
-        self.frouter_handler = fl_eventcallback(FS.fluid_synth_handle_midi_event)
+        self._settings = {} # allow real-time params to use the synth now
+        t = _lap(self.startup_times, "synth", t)
+        self.faudiodriver = None
+        if not offline:
+            self.faudiodriver = FS.new_fluid_audio_driver(self.st, self.fsynth)
+            t = _lap(self.startup_times, "audio driver", t)
+        self.frouter_handler = self.event_handler()
         self.frouter = FS.new_fluid_midi_router(self.st, self.frouter_handler, self.fsynth)
         if midi_handler:
             self.fdriver_handler = fl_eventcallback(
@@ -506,11 +934,17 @@ class Synth:
             )
         else:
             self.fdriver_handler = fl_eventcallback(FS.fluid_midi_router_handle_midi_event)
-        FS.new_fluid_midi_driver(self.st, self.fdriver_handler, self.frouter)
+        self.fmididriver = None
+        if not offline and midi:
+            self.fmididriver = FS.new_fluid_midi_driver(self.st, self.fdriver_handler, self.frouter)
+            t = _lap(self.startup_times, "midi driver", t)
         self.fseq = FS.new_fluid_sequencer2(0)
         self.id = FS.fluid_sequencer_register_fluidsynth(self.fseq, self.fsynth)
         self.players = {ptype: {} for ptype in PLAYER_TYPES}
         self.ladspafx = {}
+        self.fxtopology = ()
+        self.sfonts = {} # fsfont: SoundFont
+        self._outputs = None
         if ladspa_available:
             if self["synth.audio-groups"] == 1:
                 hostports = outports = [("Main:L", "Main:R")]
@@ -519,11 +953,97 @@ class Synth:
                 outports = hostports[0:self["synth.audio-channels"]] * self["synth.audio-groups"]
             self.port_mapping = list(zip(hostports, outports))
             self.ladspa = FS.fluid_synth_get_ladspa_fx(self.fsynth)
+        _lap(self.startup_times, "sequencer", t)
 
     @property
     def currenttick(self):
         return FS.fluid_sequencer_get_tick(self.fseq)
 
+    def stop_audio(self):
+        """Stops the audio driver, so the synth is no longer heard"""
+        if self.faudiodriver:
+            FS.delete_fluid_audio_driver(self.faudiodriver)
+            self.faudiodriver = None
+
+    def delete(self):
+        """
+        Stops the synth and frees it, its drivers and its sequencer.
+        Its soundfonts are unloaded first, since they belong to the
+        registry's owner synth. The synth can't be used afterwards.
+        """
+        if self.fsynth is None:
+            return
+        self.stop_audio()
+        if self.fmididriver:
+            FS.delete_fluid_midi_driver(self.fmididriver)
+            self.fmididriver = None
+        self.reset()
+        for sfont in list(self.sfonts.values()):
+            self.unload_soundfont(sfont)
+        FS.delete_fluid_sequencer(self.fseq)
+        FS.delete_fluid_midi_router(self.frouter)
+        FS.delete_fluid_synth(self.fsynth)
+        FS.delete_fluid_settings(self.st)
+        self.fsynth = None
+
+    def event_handler(self):
+        """The callback routers use to deliver MIDI events to the synth"""
+        return fl_eventcallback(FS.fluid_synth_handle_midi_event)
+
+    def process(self, buffers, frames=None, fxbuffers=None):
+        """
+        Renders audio into separate float32 buffers, one per channel:
+        left and right of the first output, then of the next... Dry
+        audio of each audio group is mixed into output
+        ``group % outputs``, as with a multi-channel audio driver, and
+        reverb and chorus into the first output, or into the left and
+        right ``fxbuffers`` if given. Only for offline synths, which have
+        no audio driver.
+
+        The ctypes views and pointer arrays for the buffers are kept, so
+        passing the same buffers again doesn't allocate anything. Renders
+        as many frames as the buffers hold unless ``frames`` is given,
+        and returns the number of frames.
+        """
+        fxbuffers = list(fxbuffers or ())
+        buffers = list(buffers) + fxbuffers
+        if (
+            self._outputs is None
+            or len(buffers) != len(self._outputs[0])
+            or any(a is not b for a, b in zip(buffers, self._outputs[0]))
+        ):
+            self._outputs = self._output_pointers(buffers, len(fxbuffers))
+        _, size, views, outptrs, fxptrs = self._outputs
+        if frames is None:
+            frames = size
+        elif frames > size:
+            raise ValueError(f"Buffers hold only {size} frames")
+        for view in views:
+            memset(view, 0, 4 * frames) # fluidsynth adds to the buffers
+        FS.fluid_synth_process(self.fsynth, frames, 2, fxptrs, len(outptrs), outptrs)
+        return frames
+
+    def _output_pointers(self, buffers, nfx):
+        nout = len(buffers) - nfx
+        if not nout or nout % 2 or nout > 2 * self["synth.audio-channels"]:
+            raise ValueError(
+                "Need a left and right buffer for each of up to "
+                f"{self['synth.audio-channels']} outputs (synth.audio-channels)"
+            )
+        if nfx not in (0, 2):
+            raise ValueError("Need a left and right buffer for effects")
+        views = []
+        for buf in buffers:
+            mv = memoryview(buf)
+            if mv.format not in ("f", "<f", "=f") or not mv.c_contiguous:
+                raise ValueError("Buffers must be contiguous float32 arrays")
+            views.append((c_float * (mv.nbytes // 4)).from_buffer(buf))
+        size = min(len(v) for v in views)
+        outptrs = (c_void_p * nout)(*map(addressof, views[:nout]))
+        # without effects buffers, effects are mixed into the first output
+        fxptrs = (c_void_p * 2)(*map(addressof, views[nout:] or views[:2]))
+        return buffers, size, views, outptrs, fxptrs
+
     def reset(self):
         for ptype in PLAYER_TYPES:
             for name in list(self.players[ptype]):
@@ -531,43 +1051,62 @@ class Synth:
         self.fxchain_clear()
         FS.fluid_synth_system_reset(self.fsynth)
 
+    def setting(self, name):
+        """Returns a cached accessor for the named setting"""
+        if name not in self._settings:
+            if self.fsynth and direct_params and name in SYNTH_PARAMS:
+                self._settings[name] = SynthParam(self.st, name, self.fsynth)
+            else:
+                self._settings[name] = FluidSetting(self.st, name)
+        return self._settings[name]
+
     def __getitem__(self, name):
-        stype = FS.fluid_settings_get_type(self.st, name.encode())
-        if stype == FLUID_STR_TYPE:
-            strval = create_string_buffer(32)
-            if FS.fluid_settings_copystr(self.st, name.encode(), strval, 32) == FLUID_OK:
-                return strval.value.decode()
-        elif stype == FLUID_INT_TYPE:
-            val = c_int()
-            if FS.fluid_settings_getint(self.st, name.encode(), byref(val)) == FLUID_OK:
-                return val.value
-        elif stype == FLUID_NUM_TYPE:
-            num = c_double()
-            if FS.fluid_settings_getnum(self.st, name.encode(), byref(num)) == FLUID_OK:
-                return round(num.value, 6)
-        return None
+        return self.setting(name).get()
 
     def __setitem__(self, name, val):
-        stype = FS.fluid_settings_get_type(self.st, name.encode())
-        if stype == FLUID_STR_TYPE:
-            FS.fluid_settings_setstr(self.st, name.encode(), str(val).encode())
-        elif stype == FLUID_INT_TYPE:
-            FS.fluid_settings_setint(self.st, name.encode(), int(val))
-        elif stype == FLUID_NUM_TYPE:
-            FS.fluid_settings_setnum(self.st, name.encode(), c_double(float(val)))
+        self.setting(name).set(val)
 
     def load_soundfont(self, path):
-        sfid = FS.fluid_synth_sfload(self.fsynth, str(path).encode(), False)
+        fsfont, presets = sfont_registry.acquire(str(path))
+        programs = self._channel_programs()
+        sfid = FS.fluid_synth_add_sfont(self.fsynth, fsfont)
         if sfid == FLUID_FAILED:
-            raise OSError(f"Unable to load {file}")
-        fsfont = FS.fluid_synth_get_sfont_by_id(self.fsynth, sfid)
-        return SoundFont(fsfont, sfid)
+            sfont_registry.release(fsfont)
+            raise OSError(f"Unable to load {path}")
+        self._restore_programs(programs)
+        self.sfonts[fsfont] = SoundFont(fsfont, sfid, presets)
+        return self.sfonts[fsfont]
 
     def unload_soundfont(self, sfont):
-        FS.fluid_synth_sfunload(self.fsynth, sfont.id, False)
+        programs = self._channel_programs()
+        FS.fluid_synth_remove_sfont(self.fsynth, sfont.fsfont)
+        self._restore_programs(programs)
+        del self.sfonts[sfont.fsfont]
+        sfont_registry.release(sfont.fsfont)
+
+    def _channel_programs(self):
+        # adding or removing a font resets every channel's program, so
+        # note them by font name, which unlike the font id is the same
+        # in the owner synth and this one
+        programs = []
+        for chan in range(self["synth.midi-channels"]):
+            if preset := FS.fluid_synth_get_channel_preset(self.fsynth, chan):
+                programs.append((
+                    chan,
+                    FS.fluid_sfont_get_name(FS.fluid_preset_get_sfont(preset)),
+                    FS.fluid_preset_get_banknum(preset),
+                    FS.fluid_preset_get_num(preset),
+                ))
+        return programs
+
+    def _restore_programs(self, programs):
+        for chan, name, bank, prog in programs:
+            FS.fluid_synth_program_select_by_sfont_name(self.fsynth, chan, name, bank, prog)
 
     def program_select(self, chan, sfont, bank, prog):
-        x = FS.fluid_synth_program_select(self.fsynth, chan - 1, sfont.id, bank, prog)
+        x = FS.fluid_synth_program_select_by_sfont_name(
+            self.fsynth, chan - 1, sfont.name, bank, prog
+        )
         return True if x == FLUID_OK else False
 
     def program_unset(self, chan):
@@ -578,6 +1117,10 @@ class Synth:
         bank = c_int()
         prog = c_int()
         FS.fluid_synth_get_program(self.fsynth, chan - 1, byref(i), byref(bank), byref(prog))
+        # a font's id changes when a synth adds it, so map it back
+        if preset := FS.fluid_synth_get_channel_preset(self.fsynth, chan - 1):
+            if sfont := self.sfonts.get(FS.fluid_preset_get_sfont(preset)):
+                return sfont.id, bank.value, prog.value
         return i.value, bank.value, prog.value
 
     def get_cc(self, chan, num):
@@ -691,14 +1234,44 @@ class Synth:
             del self.players[ptype][name]
 
     def fxchain_clear(self):
+        if not ladspa_available:
+            return
         FS.fluid_ladspa_reset(self.ladspa)
         self.ladspafx = {}
+        self.fxtopology = ()
+
+    def fxchain_update(self, effects):
+        """
+        Makes the effects chain match ``effects``. The chain is only
+        torn down and rebuilt if its topology (effect names, plugins
+        and audio routing) changed - otherwise changed control values
+        are applied to the running effects in place. Ports that an
+        effect no longer declares also force a rebuild, so they go back
+        to their plugin defaults.
+        """
+        if not ladspa_available:
+            return
+        topology = fxchain_topology(effects)
+        if topology == self.fxtopology and all(
+            self.ladspafx[name].update(getattr(fx, "vals", {}))
+            for name, fx in effects.items()
+        ):
+            return
+        self.fxchain_clear()
+        for name, fx in effects.items():
+            self.fxchain_add(name, fx)
+        self.fxchain_connect()
+        self.fxtopology = topology
 
     def fxchain_add(self, name, fx):
+        if not ladspa_available:
+            return
         if name not in self.ladspafx:
             self.ladspafx[name] = LadspaEffect(self, name, fx)
 
     def fxchain_connect(self):
+        if not ladspa_available:
+            return
         b = -1
         for hostports, outports in self.port_mapping:
             effects = [e for e in self.ladspafx.values() if hostports in e.links]
@@ -714,8 +1287,4 @@ class Synth:
             effects[-1].link(hostports, lastports, outports)
         FS.fluid_ladspa_activate(self.ladspa)
 
-    if not ladspa_available:
-        def fxchain_clear(self): pass
-        def fxchain_add(self, _, __): pass
-        def fxchain_connect(self): pass
 
@@ -0,0 +1,214 @@
+"""
+Offline rendering without a sound card.
+
+A Synth created with ``offline=True`` has no audio or MIDI driver, and
+its sequencer and MIDI file players run on the synth's sample clock
+instead of the system clock. This module pulls audio from such a synth
+as fast as the CPU allows, running timed events between blocks, and
+collects it in memory or writes it to 32-bit float WAV files, either as
+a stereo mix or as a stereo stem for each audio group.
+
+It is used by ``FluidPatcher.render()``.
+"""
+from array import array
+import struct
+import sys
+import time
+
+# frames rendered per call when no event falls inside the block
+BLOCKSIZE = 4096
+
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+
+class WavWriter:
+    """
+    Streams interleaved 32-bit float samples to a WAV file.
+
+    The header is written with empty sizes when the file is opened and
+    filled in on ``close()``, so long renders never need to be held in
+    memory.
+
+    Args:
+      path (str|Path): Output file
+      rate (int): Sample rate in Hz
+      channels (int): Number of interleaved channels (default: ``2``)
+    """
+
+    def __init__(self, path, rate, channels=2):
+        self.rate = int(rate)
+        self.channels = channels
+        self.frames = 0
+        self.f = open(path, "wb")
+        self.f.write(self._header())
+
+    def _header(self):
+        blockalign = 4 * self.channels
+        fmt = struct.pack(
+            "<HHIIHHH", WAVE_FORMAT_IEEE_FLOAT, self.channels, self.rate,
+            self.rate * blockalign, blockalign, 32, 0
+        )
+        datasize = self.frames * blockalign
+        return b"".join([
+            b"RIFF", struct.pack("<I", 50 + datasize), b"WAVE",
+            b"fmt ", struct.pack("<I", len(fmt)), fmt,
+            b"fact", struct.pack("<II", 4, self.frames),
+            b"data", struct.pack("<I", datasize),
+        ])
+
+    def write(self, samples):
+        """
+        Appends samples.
+
+        Args:
+          samples (bytes-like): Interleaved native float samples
+        """
+        if sys.byteorder == "big":
+            swapped = array("f")
+            swapped.frombytes(samples)
+            swapped.byteswap()
+            samples = swapped
+        self.f.write(samples)
+        self.frames += memoryview(samples).nbytes // (4 * self.channels)
+
+    def close(self):
+        """Fills in the header sizes and closes the file."""
+        self.f.seek(0)
+        self.f.write(self._header())
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StemWriter:
+    """
+    Streams several stereo stems to one WAV file each, in a single pass
+    over the rendered audio.
+
+    Args:
+      paths (list[str|Path]): Output file for each stem
+      rate (int): Sample rate in Hz
+    """
+
+    def __init__(self, paths, rate):
+        self.writers = [WavWriter(path, rate) for path in paths]
+        self.block = array("f")
+
+    def write(self, pairs, frames):
+        """
+        Appends frames to every stem.
+
+        Args:
+          pairs (list[tuple]): Left and right float32 arrays for each
+            stem, in the order of ``paths``
+          frames (int): Number of frames to take from each array
+        """
+        if len(self.block) < 2 * frames:
+            self.block = array("f", bytes(8 * frames))
+        for writer, (left, right) in zip(self.writers, pairs):
+            writer.write(_interleave(self.block, left, right, frames))
+
+    def close(self):
+        """Closes all the files."""
+        for writer in self.writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _interleave(block, left, right, frames):
+    # slice assignment copies in C, much faster than a loop
+    block[0:2 * frames:2] = left[:frames]
+    block[1:2 * frames:2] = right[:frames]
+    return memoryview(block).cast("B")[:8 * frames]
+
+
+def render(synth, duration=None, events=(), done=None, out=None, tail=0.0,
+           blocksize=BLOCKSIZE, stems=False, blocktimes=None):
+    """
+    Renders audio from an offline synth, as a stereo mix or as stems.
+
+    Args:
+      synth (Synth): A synth created with ``offline=True``
+      duration (float): Seconds to render, or ``None`` to render until
+        all events have run and ``done()`` is true, plus ``tail``. A
+        player that loops forever needs a duration.
+      events (list[tuple[float, callable]]): Functions to call at times
+        in seconds from the start of the render, e.g. to send MIDI.
+        Each runs before the sample at its time is rendered.
+      done (callable): Returns true once playback has finished
+      out (WavWriter|StemWriter): Writer to stream the audio to, a
+        StemWriter with a path for each stem if ``stems`` is true
+      tail (float): Seconds to keep rendering after the end
+      blocksize (int): Largest number of frames to render at once
+      stems (bool): Render each audio group as its own stereo stem,
+        followed by one stem with the reverb and chorus. Needs as many
+        ``synth.audio-channels`` as ``synth.audio-groups``, which is
+        the default for offline synths.
+      blocktimes (list): If given, a ``(frames, seconds)`` tuple is
+        appended for each block, timing how long the synth took to
+        render it
+
+    Returns:
+      (array|list[array]|int): The interleaved stereo samples, a list
+      of them for each stem, or the number of frames written if ``out``
+      was given
+    """
+    rate = synth["synth.sample-rate"]
+    events = sorted(
+        [(round(t * rate), func) for t, func in events], key=lambda e: e[0]
+    )
+    end = None if duration is None else round(duration * rate)
+    nout, fxbuffers = 1, None
+    if stems:
+        nout = synth["synth.audio-groups"]
+        if synth["synth.audio-channels"] < nout:
+            raise ValueError("Stems need synth.audio-channels >= synth.audio-groups")
+        fxbuffers = [array("f", bytes(4 * blocksize)) for _ in range(2)]
+    buffers = [array("f", bytes(4 * blocksize)) for _ in range(2 * nout)]
+    pairs = list(zip(buffers[0::2], buffers[1::2]))
+    if fxbuffers:
+        pairs.append(tuple(fxbuffers))
+    block = array("f", bytes(8 * blocksize))
+    audio = [array("f") for _ in pairs] if out is None else None
+    frame = i = 0
+    while True:
+        while i < len(events) and events[i][0] <= frame:
+            events[i][1]()
+            i += 1
+        if end is None and i == len(events) and (done is None or done()):
+            end = frame + round(tail * rate)
+        if end is not None and frame >= end:
+            break
+        n = blocksize
+        if i < len(events):
+            n = min(n, events[i][0] - frame)
+        if end is not None:
+            n = min(n, end - frame)
+        if blocktimes is None:
+            synth.process(buffers, n, fxbuffers)
+        else:
+            t = time.perf_counter()
+            synth.process(buffers, n, fxbuffers)
+            blocktimes.append((n, time.perf_counter() - t))
+        if stems and out is not None:
+            out.write(pairs, n)
+        else:
+            for k, (left, right) in enumerate(pairs):
+                samples = _interleave(block, left, right, n)
+                if out is None:
+                    audio[k].frombytes(samples)
+                else:
+                    out.write(samples)
+        frame += n
+    if out is not None:
+        return frame
+    return audio if stems else audio[0]
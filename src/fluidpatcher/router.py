@@ -3,7 +3,9 @@ Python handler for fluidsynth midi events
 with extensible custom router rules
 """
 
-from .pfluidsynth import PLAYER_TYPES
+import threading
+
+from .pfluidsynth import PLAYER_TYPES, SeqClient
 
 
 class RouterEvent:
@@ -22,6 +24,9 @@ class RouterRule:
 
     def __init__(self, rule):
         self.__dict__.update(rule.__dict__)
+        if hasattr(self, "chan"):
+            # a single rule covers every channel it fans out to
+            self._tochans = self.chan.tovals
 
     def applies(self, event):
         if self.type != event.type:
@@ -37,11 +42,16 @@ class RouterRule:
         return True
 
     def apply(self, event):
+        if hasattr(self, "chan"):
+            return [self._route(event, tochan) for tochan in self._tochans]
+        return [self._route(event)]
+
+    def _route(self, event, tochan=None):
         newevent = RouterEvent(event, self)
         newevent.type = self.totype
         if hasattr(event, "chan"):
             if hasattr(self, "chan"):
-                newevent.chan = int(event.chan * self.chan.mul + self.chan.add)
+                newevent.chan = tochan
             if hasattr(self, "val"):
                 if hasattr(self, "log"):
                     b = 10 ** self.log
@@ -76,28 +86,90 @@ class RouterRule:
 
 class FluidRule:
 
-    def __init__(self, rule):
+    def __init__(self, rule, chan=None):
         self.type = rule.type
         for par in "chan", "num", "val":
             if route := getattr(rule, par, None):
                 setattr(self, par, route)
+        if chan:
+            self.chan = chan
+
+
+class Coalescer(SeqClient):
+    """
+    Throttles writes to continuous targets (fluidsettings, fx controls)
+    so each target is written at most once per interval. Values that
+    arrive in between replace each other and only the latest is applied
+    when the interval expires.
+    """
+
+    def __init__(self, synth):
+        super().__init__(synth)
+        self.pending = {}
+        self.ready = {}
+        self.writes = 0
+        self.merged = 0
+        # write() runs on the MIDI thread and scheduler() on the synth's,
+        # so both decide under the lock and write outside it
+        self.lock = threading.Lock()
+
+    def write(self, target, interval, func, *args):
+        t = self.synth.currenttick
+        with self.lock:
+            if target in self.pending:
+                self.merged += 1
+                self.pending[target] = interval, func, args
+                return
+            if t < self.ready.get(target, 0):
+                self.pending[target] = interval, func, args
+                due = self.ready[target]
+            else:
+                self.writes += 1
+                self.ready[target] = t + interval
+                due = None
+        if due is None:
+            func(*args)
+        else:
+            self.synth.schedule_callback(self.id, due)
+
+    def scheduler(self):
+        t = self.synth.currenttick
+        with self.lock:
+            due = []
+            for target, (interval, func, args) in list(self.pending.items()):
+                if t >= self.ready[target]:
+                    del self.pending[target]
+                    due.append((func, args))
+                    self.writes += 1
+                    self.ready[target] = t + interval
+        for func, args in due:
+            func(*args)
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+            self.ready = {}
 
 
 class Router:
 
-    def __init__(self, fluid_default=False, fluid_router=False):
+    def __init__(self, fluid_default=False, fluid_router=False, coalesce=0):
         self.fluid_default = fluid_default
         self.fluid_router = fluid_router
+        self.coalesce = coalesce
         self.rules = []
         self.fluidrules = []
         self.counters = {}
         self.synth = None
         self.callback = lambda event: None
         self.clocks = [0, 0]
+        self.coalescer = None
 
     def reset(self):
         self.rules = []
         self.fluidrules = []
+        if self.coalescer:
+            self.coalescer.clear()
         if self.fluid_router:
             self.synth.router_clear()
             if self.fluid_default:
@@ -108,11 +180,12 @@ class Router:
             self.fluid_router
             and rule.type == rule.totype
             and rule.type in ("note", "kpress", "ctrl", "prog", "cpress", "pbend")
-            and not set(rule.__dict__) - {"type", "totype", "chan", "num", "val", "_pars"}
+            and not set(rule.__dict__) - {"type", "totype", "chan", "num", "val", "_parkeys", "_parvals"}
            ):
             if hasattr(rule, "chan"):
+                # fluidsynth rules can't fan out, so expand them here
                 for tochan in rule.chan:
-                    self.fluidrules.append(FluidRule(rule.copy(chan=tochan)))
+                    self.fluidrules.append(FluidRule(rule, chan=tochan))
             else:
                 self.fluidrules.append(FluidRule(rule))
             self.synth.router_clear()
@@ -122,11 +195,22 @@ class Router:
             for rule in self.fluidrules[::-1]:
                 self.synth.router_addrule(rule)
         else:
-            if hasattr(rule, "chan"):
-                for tochan in rule.chan:
-                    self.rules.append(RouterRule(rule.copy(chan=tochan)))
-            else:
-                self.rules.append(RouterRule(rule))
+            rule = RouterRule(rule)
+            if hasattr(rule, "fx"):
+                # resolve the effect control once instead of per event
+                fx, port = rule.fx.split(">")
+                if fx in self.synth.ladspafx:
+                    rule._fxcontrol = self.synth.ladspafx[fx].control(port)
+            self.rules.append(rule)
+
+    def write(self, rule, target, func, *args):
+        interval = getattr(rule, "coalesce", self.coalesce)
+        if interval <= 0:
+            func(*args)
+            return
+        if self.coalescer is None:
+            self.coalescer = Coalescer(self.synth)
+        self.coalescer.write(target, interval, func, *args)
 
     def find_players(self, name):
         return [self.synth.players[ptype][name]
@@ -141,61 +225,60 @@ class Router:
         t = self.synth.currenttick
         dt = 0
         for rule in [r for r in self.rules if r.applies(event)]:
-            newevent = rule.apply(event)
-            if hasattr(rule, "counter"):
-                if rule.counter in self.counters:
-                    c = self.counters[rule.counter]
-                    c.val += newevent.val
-                    if c.val > c.max:
-                        c.val = c.min if c.wrap else c.max
-                    elif c.val < c.min:
-                        c.val = c.max if c.wrap else c.min
-                    newevent.val = c.val
-            if hasattr(rule, "lsb"):
-                lsbevent = RouterEvent(newevent, rule)
-                lsbevent.num, lsbevent.val = rule.lsb, newevent.lsbval
-                self.synth.send_midievent(lsbevent)
-            if hasattr(rule, "fluidsetting"):
-                self.synth[rule.fluidsetting] = newevent.val
-            if hasattr(rule, "play"):
-                for player in self.find_players(rule.play):
-                    player.play(newevent.val)
-            if hasattr(rule, "tempo"):
-                for player in self.find_players(rule.tempo):
-                    player.set_tempo(newevent.val)
-            if hasattr(rule, "tap"):
-                for player in self.find_players(rule.tap):
-                    dt, dt2 = t - self.clocks[0], self.clocks[0] - self.clocks[1]
-                    if dt2/dt > 0.5: # wait for three taps of similar spacing
-                        bpm = 1000 * 60 * newevent.val / dt
-                        player.set_tempo(bpm)
-            if hasattr(rule, "record"):
-                for player in self.find_players(rule.record):
-                    if hasattr(player, "record"):
-                        player.record(newevent.val)
-            if hasattr(rule, "arpeggio"):
-                for player in self.find_players(rule.arpeggio):
-                    if hasattr(player, "add"):
-                        player.add(newevent.copy())
-                        newevent.val = 0
-            if hasattr(rule, "loop"):
-                for player in self.find_players(rule.loop):
-                    if hasattr(player, "add"):
-                        player.add(newevent.copy())
-            if hasattr(rule, "swing"):
-                for player in self.find_players(rule.swing):
-                    if hasattr(player, "set_swing"):
-                        player.set_swing(newevent.val)
-            if hasattr(rule, "groove"):
-                for player in self.find_players(rule.groove):
-                    if hasattr(player, "set_groove"):
-                        player.set_groove(newevent.val)
-            if hasattr(rule, "fx"):
-                fx, port = rule.fx.split(">")
-                if fx in self.synth.ladspafx:
-                    self.synth.ladspafx[fx].setcontrol(port, newevent.val)
-            self.synth.send_midievent(newevent) # send routed event to synth
-            self.callback(newevent) # forward the routed event for user handling
+            for newevent in rule.apply(event):
+                if hasattr(rule, "counter"):
+                    if rule.counter in self.counters:
+                        c = self.counters[rule.counter]
+                        c.val += newevent.val
+                        if c.val > c.max:
+                            c.val = c.min if c.wrap else c.max
+                        elif c.val < c.min:
+                            c.val = c.max if c.wrap else c.min
+                        newevent.val = c.val
+                if hasattr(rule, "lsb"):
+                    lsbevent = RouterEvent(newevent, rule)
+                    lsbevent.num, lsbevent.val = rule.lsb, newevent.lsbval
+                    self.synth.send_midievent(lsbevent)
+                if hasattr(rule, "fluidsetting"):
+                    self.write(rule, rule.fluidsetting,
+                               self.synth.__setitem__, rule.fluidsetting, newevent.val)
+                if hasattr(rule, "play"):
+                    for player in self.find_players(rule.play):
+                        player.play(newevent.val)
+                if hasattr(rule, "tempo"):
+                    for player in self.find_players(rule.tempo):
+                        player.set_tempo(newevent.val)
+                if hasattr(rule, "tap"):
+                    for player in self.find_players(rule.tap):
+                        dt, dt2 = t - self.clocks[0], self.clocks[0] - self.clocks[1]
+                        if dt2/dt > 0.5: # wait for three taps of similar spacing
+                            bpm = 1000 * 60 * newevent.val / dt
+                            player.set_tempo(bpm)
+                if hasattr(rule, "record"):
+                    for player in self.find_players(rule.record):
+                        if hasattr(player, "record"):
+                            player.record(newevent.val)
+                if hasattr(rule, "arpeggio"):
+                    for player in self.find_players(rule.arpeggio):
+                        if hasattr(player, "add"):
+                            player.add(newevent.copy())
+                            newevent.val = 0
+                if hasattr(rule, "loop"):
+                    for player in self.find_players(rule.loop):
+                        if hasattr(player, "add"):
+                            player.add(newevent.copy())
+                if hasattr(rule, "swing"):
+                    for player in self.find_players(rule.swing):
+                        if hasattr(player, "set_swing"):
+                            player.set_swing(newevent.val)
+                if hasattr(rule, "groove"):
+                    for player in self.find_players(rule.groove):
+                        if hasattr(player, "set_groove"):
+                            player.set_groove(newevent.val)
+                if hasattr(rule, "_fxcontrol"):
+                    self.write(rule, rule.fx, rule._fxcontrol.set, newevent.val)
+                self.synth.send_midievent(newevent) # send routed event to synth
+                self.callback(newevent) # forward the routed event for user handling
         if dt > 0:
             self.clocks = t, self.clocks[0]
 
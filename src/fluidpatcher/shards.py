@@ -0,0 +1,358 @@
+"""
+Spreads a synth's voices across worker processes.
+
+One libfluidsynth instance renders on a single CPU core, which dense
+patches can saturate. A ShardedSynth is an offline Synth that plays no
+notes itself: its sequencer, players and MIDI router run as usual, but
+every channel message they produce is passed to one of several worker
+processes, each running its own offline Synth for a share of the MIDI
+channels. Every worker loads every soundfont, so program changes sent
+as MIDI find the same fonts they would on a single synth. The
+workers render each block in parallel into shared memory. Outputs fed
+by a single worker are copied into the caller's buffers, the others
+are summed - in C if numpy is installed.
+
+Used by ``FluidPatcher(shards=N)``.
+"""
+from array import array
+import heapq
+from itertools import count
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+from operator import add
+import weakref
+
+try:
+    import numpy
+except ImportError: # outputs are summed in Python instead
+    numpy = None
+
+from .pfluidsynth import FLUID_OK, FluidMidiEvent, SoundFont, Synth, fl_eventcallback
+
+# largest block the workers render at once - events reach the workers
+# between blocks, so this bounds their timing error (about 6 ms)
+SHARD_BLOCK = 256
+
+
+class _Message:
+    """A channel message in the form Synth.send_midievent() takes"""
+
+    __slots__ = "type", "chan", "num", "val"
+
+    def __init__(self, type, chan, num=0, val=0):
+        self.type, self.chan, self.num, self.val = type, chan, num, val
+
+
+class _ShardFont(SoundFont):
+    """A soundfont loaded by a worker, known to the main process by its presets"""
+
+    def __init__(self, sfid, path, presets):
+        self.id = sfid
+        self.path = path
+        self._presets = presets
+
+
+class _Shard:
+    """Main-process end of a worker: its pipe, its audio and its pending ops"""
+
+    def __init__(self, ctx, index, fluidsettings, channels):
+        self.index = index
+        self.shm = shared_memory.SharedMemory(create=True, size=4 * SHARD_BLOCK * 2 * (channels + 1))
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker, args=(child, self.shm.name, fluidsettings), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.samples = self.shm.buf.cast("f")
+        self.buffers = [
+            self.samples[i * SHARD_BLOCK:(i + 1) * SHARD_BLOCK]
+            for i in range(2 * (channels + 1))
+        ]
+        self.arrays = self.buffers
+        if numpy:
+            self.arrays = [numpy.frombuffer(b, numpy.float32) for b in self.buffers]
+        self.ops = []
+
+    def send(self, *req):
+        # pending ops go first, so the worker sees everything in order
+        try:
+            self.conn.send((self.ops, req))
+        except OSError:
+            raise self._died() from None
+        self.ops = []
+
+    def recv(self):
+        # poll, so a worker that died can't leave us waiting forever
+        while not self.conn.poll(1):
+            if not self.process.is_alive():
+                raise self._died()
+        try:
+            return self.conn.recv()
+        except EOFError:
+            raise self._died() from None
+
+    def request(self, *req):
+        self.send(*req)
+        return self.recv()
+
+    def _died(self):
+        self.process.join(1)
+        return RuntimeError(
+            f"Shard {self.index} worker process died (exit code {self.process.exitcode})"
+        )
+
+    def close(self):
+        try:
+            self.conn.send(([], ("quit",)))
+        except OSError:
+            pass
+        self.process.join(1)
+        self.buffers = self.arrays = []
+        self.samples.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _shutdown(shards):
+    for shard in shards:
+        shard.close()
+
+
+class ShardedSynth(Synth):
+    """
+    An offline Synth whose voices are played by worker processes.
+
+    MIDI channel ``chan`` is played by worker ``(chan - 1) % shards``.
+    Settings and program changes are applied to the worker that owns
+    the channel, or to all of them, so the synth can be used like any
+    other offline Synth. LADSPA effects are not supported.
+
+    Args:
+      fluidsettings (dict): FluidSynth settings for every worker
+      logfunc (callable): Log function for the main synth
+      midi_handler (callable): Unused, offline synths have no MIDI driver
+      shards (int): Number of worker processes
+    """
+
+    def __init__(self, fluidsettings={}, logfunc=None, midi_handler=None, shards=2):
+        self.shards = []
+        self.scheduled = []
+        self.order = count()
+        self.sfids = count(1)
+        super().__init__(fluidsettings, logfunc, midi_handler, offline=True)
+        fluidsettings = fluidsettings | {
+            "synth.audio-channels": self["synth.audio-channels"]
+        }
+        ctx = multiprocessing.get_context()
+        self.shards = [
+            _Shard(ctx, i, fluidsettings, self["synth.audio-channels"])
+            for i in range(shards)
+        ]
+        self._finalizer = weakref.finalize(self, _shutdown, self.shards)
+        # the main synth only keeps time, so it renders into scratch buffers
+        self._scratch = [array("f", bytes(4 * SHARD_BLOCK)) for _ in range(2)]
+        self._targets = None
+
+    def close(self):
+        """Stops the worker processes."""
+        self._finalizer()
+
+    def delete(self):
+        super().delete()
+        self.close()
+
+    def event_handler(self):
+        return fl_eventcallback(lambda _, e: self._dispatch(FluidMidiEvent(e)) or FLUID_OK)
+
+    def _owner(self, chan):
+        return self.shards[(chan - 1) % len(self.shards)]
+
+    def _dispatch(self, event):
+        if getattr(event, "chan", None) is None:
+            return
+        self._owner(event.chan).ops.append(
+            ("midi", event.type, event.chan, getattr(event, "num", 0), event.val)
+        )
+
+    def _broadcast(self, *op):
+        for shard in self.shards:
+            shard.ops.append(op)
+
+    def __setitem__(self, name, val):
+        super().__setitem__(name, val)
+        self._broadcast("set", name, val)
+
+    def send_midievent(self, event, route=False):
+        if route:
+            super().send_midievent(event, route)
+        else:
+            self._dispatch(event)
+
+    def schedule_event(self, event, id=-1, time=None):
+        if not hasattr(event, "chan"):
+            return
+        if time == None:
+            time = self.currenttick
+        heapq.heappush(self.scheduled, (int(time), next(self.order), event))
+
+    def load_soundfont(self, path):
+        # every worker loads the font, in parallel, so program changes
+        # arriving as MIDI messages see the same font stack in each
+        sfid = next(self.sfids)
+        for shard in self.shards:
+            shard.send("load", sfid, str(path))
+        presets = [shard.recv() for shard in self.shards]
+        return _ShardFont(sfid, str(path), presets[0])
+
+    def unload_soundfont(self, sfont):
+        self._broadcast("unload", sfont.id)
+
+    def program_select(self, chan, sfont, bank, prog):
+        self._owner(chan).ops.append(("select", chan, sfont.id, bank, prog))
+        return True
+
+    def program_unset(self, chan):
+        self._owner(chan).ops.append(("unset", chan))
+
+    def program_info(self, chan):
+        return self._owner(chan).request("program_info", chan)
+
+    def get_cc(self, chan, num):
+        return self._owner(chan).request("get_cc", chan, num)
+
+    def reset(self):
+        super().reset()
+        self.scheduled = []
+        self._broadcast("reset")
+
+    def fxchain_update(self, effects):
+        pass
+
+    def process(self, buffers, frames=None, fxbuffers=None):
+        """
+        Renders audio like ``Synth.process()``, with the workers playing
+        the voices in parallel.
+        """
+        buffers = list(buffers) + list(fxbuffers or ())
+        if (
+            self._targets is None
+            or len(buffers) != len(self._targets[0])
+            or any(a is not b for a, b in zip(buffers, self._targets[0]))
+        ):
+            _, size, *_ = self._output_pointers(buffers, len(fxbuffers or ())) # validates
+            self._targets = buffers, size, self._mixing(buffers, fxbuffers)
+        _, size, mixing = self._targets
+        if frames is None:
+            frames = size
+        elif frames > size:
+            raise ValueError(f"Buffers hold only {size} frames")
+        nout = len(buffers) - (2 if fxbuffers else 0)
+        rate = self["synth.sample-rate"]
+        pos = 0
+        while pos < frames:
+            tick = self.currenttick
+            while self.scheduled and self.scheduled[0][0] <= tick:
+                self._dispatch(heapq.heappop(self.scheduled)[2])
+            n = min(SHARD_BLOCK, frames - pos)
+            if self.scheduled:
+                # end the block at the next scheduled event
+                n = min(n, max(1, math.ceil((self.scheduled[0][0] - tick) * rate / 1000)))
+            super().process(self._scratch, n) # runs the sequencer and players
+            for shard in self.shards:
+                shard.send("render", n, nout, bool(fxbuffers))
+            for shard in self.shards:
+                shard.recv()
+            for view, total, j, (first, *rest) in mixing:
+                view[pos:pos + n] = first.buffers[j][:n]
+                for shard in rest:
+                    if total is None:
+                        view[pos:pos + n] = array(
+                            "f", map(add, view[pos:pos + n], shard.buffers[j][:n])
+                        )
+                    else:
+                        numpy.add(total[pos:pos + n], shard.arrays[j][:n], out=total[pos:pos + n])
+            pos += n
+        return frames
+
+    def _mixing(self, buffers, fxbuffers):
+        # for each output, its worker buffer and the workers that feed it -
+        # a MIDI channel plays into audio group (chan - 1) % groups, which
+        # fluid_synth_process() mixes into stereo output group % pairs
+        nfx = 2 if fxbuffers else 0
+        nout = len(buffers) - nfx
+        groups = self["synth.audio-groups"]
+        feeds = [set() for _ in range(nout // 2)]
+        for chan in range(self["synth.midi-channels"]):
+            feeds[chan % groups % (nout // 2)].add(self.shards[chan % len(self.shards)])
+        if not fxbuffers:
+            # effects are mixed into the first output
+            feeds[0] = set(self.shards)
+        mixing = []
+        for k, target in enumerate(buffers):
+            if k < nout:
+                j, sources = k, [s for s in self.shards if s in feeds[k // 2]]
+            else:
+                j, sources = k - len(buffers), self.shards
+            # an output nothing plays into still gets a worker's silence
+            sources = sources or self.shards[:1]
+            # ctypes arrays have format "<f", which won't take "f" slices
+            view = memoryview(target).cast("B").cast("f")
+            total = None
+            if numpy and len(sources) > 1:
+                total = numpy.frombuffer(view, numpy.float32)
+            mixing.append((view, total, j, sources))
+        return mixing
+
+
+def _worker(conn, shm_name, fluidsettings):
+    synth = Synth(fluidsettings, offline=True)
+    shm = shared_memory.SharedMemory(shm_name)
+    samples = shm.buf.cast("f")
+    buffers = [
+        samples[i:i + SHARD_BLOCK] for i in range(0, len(samples), SHARD_BLOCK)
+    ]
+    outputs = {}
+    sfonts = {} # main sfid: SoundFont
+    while True:
+        ops, (cmd, *args) = conn.recv()
+        for op, *opargs in ops:
+            if op == "midi":
+                synth.send_midievent(_Message(*opargs))
+            elif op == "set":
+                synth[opargs[0]] = opargs[1]
+            elif op == "select":
+                chan, sfid, bank, prog = opargs
+                synth.program_select(chan, sfonts[sfid], bank, prog)
+            elif op == "unset":
+                synth.program_unset(opargs[0])
+            elif op == "unload":
+                if sfont := sfonts.pop(opargs[0], None):
+                    synth.unload_soundfont(sfont)
+            elif op == "reset":
+                synth.reset()
+        if cmd == "render":
+            n, nout, fx = args
+            if (nout, fx) not in outputs:
+                outputs[nout, fx] = buffers[:nout], buffers[-2:] if fx else None
+            synth.process(*outputs[nout, fx][:1], n, outputs[nout, fx][1])
+            conn.send(n)
+        elif cmd == "load":
+            sfid, path = args
+            sfonts[sfid] = synth.load_soundfont(path)
+            conn.send(dict(sfonts[sfid].items()))
+        elif cmd == "program_info":
+            id, bank, prog = synth.program_info(args[0])
+            ids = {sfont.id: sfid for sfid, sfont in sfonts.items()}
+            conn.send((ids.get(id, id), bank, prog))
+        elif cmd == "get_cc":
+            conn.send(synth.get_cc(*args))
+        elif cmd == "quit":
+            break
+    # release the views of the shared memory before closing it
+    outputs.clear()
+    synth._outputs = None
+    buffers.clear()
+    samples.release()
+    shm.close()